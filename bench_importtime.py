@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""Import time benchmark for the web app and the send_notices.py cron job, using python -X importtime.
+
+Fails (exit status 1) when either takes longer than its budget to import, or when the cron job
+imports any of the heavy, web only dependencies.
+    python bench_importtime.py [--runs 5] [--web-budget-ms 1000] [--notices-budget-ms 750]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+
+# web only dependencies, which the cron job must not import
+NOTICES_FORBIDDEN = ['PIL', 'magic', 'youtube_api', 'pandas', 'numpy', 'flask_wtf', 'wtforms', 'flask_bootstrap', 'flask_moment', 'slack_sdk']
+
+
+def import_times(module, runs):
+    """Fastest of several cold imports of module, as (total microseconds, {imported module: cumulative microseconds})."""
+    best = None
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+            cwd=os.path.dirname(os.path.realpath(__file__)), capture_output=True, text=True,
+        )
+        if result.returncode:
+            sys.exit(f'Failed to import {module}:\n{result.stderr[-2000:]}')
+        modules = {}
+        # lines look like "import time:       self [us] |  cumulative | imported package"
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'imported package' in line:
+                continue
+            _, cumulative, name = line.split('|')
+            modules[name.strip()] = int(cumulative)
+        if best is None or modules[module] < best[1][module]:
+            best = (modules[module], modules)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='imports per module, the fastest one counts')
+    parser.add_argument('--web-budget-ms', type=int, default=1000)
+    parser.add_argument('--notices-budget-ms', type=int, default=750)
+    parser.add_argument('--top', type=int, default=8, help='slowest top level imports to show')
+    args = parser.parse_args()
+    # send_notices.py needs these to be set, any value will do
+    os.environ.setdefault('PREFERRED_URL_SCHEME', 'https')
+    os.environ.setdefault('SERVER_NAME', 'localhost')
+    failures = []
+    for module, budget_ms in [('musicleague', args.web_budget_ms), ('send_notices', args.notices_budget_ms)]:
+        total, modules = import_times(module, args.runs)
+        print(f'{module}: {total / 1000:.0f} ms (budget {budget_ms} ms)')
+        top_level = sorted(((us, name) for name, us in modules.items() if '.' not in name and name != module), reverse=True)
+        for us, name in top_level[:args.top]:
+            print(f'    {us / 1000:8.1f} ms  {name}')
+        if total / 1000 > budget_ms:
+            failures.append(f'{module} took {total / 1000:.0f} ms to import, over its {budget_ms} ms budget')
+        if module == 'send_notices':
+            heavy = [name for name in NOTICES_FORBIDDEN if name in modules]
+            if heavy:
+                failures.append(f'send_notices imports web only dependencies: {", ".join(heavy)}')
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,296 @@
+"""Cache backends shared by the web app and cron jobs, selected by CACHE_BACKEND."""
+from collections import Counter, OrderedDict
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+import uuid
+
+from config import Config
+
+
+# the app's logger, so cache warnings end up in the app logs
+logger = logging.getLogger('musicleague')
+
+
+class Cache(object):
+    """Base class of the cache backends, adding TTLs, tag based invalidation and single-flight recompute.
+
+    Backends implement load/store/remove of pickle-able values, incr/load_counters for tag versions, and acquire
+    for the lock entries of get_or_set. Entries remember the versions of their tags when stored, and are treated
+    as missing once invalidate_tag() bumps any of them.
+    """
+    MISS = object()
+
+    def __init__(self, default_ttl=None, lock_timeout=10):
+        self.default_ttl = default_ttl
+        self.lock_timeout = lock_timeout
+        self.stats = Counter()
+        # striped locks, so concurrent misses on a key are recomputed once per process, reentrant as a value's create()
+        # may get_or_set another key sharing its stripe
+        self.local_locks = [threading.RLock() for _ in range(64)]
+
+    def get(self, key, default=None):
+        entry = self.load(key)
+        if entry is not None:
+            value, tag_versions = entry
+            if not tag_versions or self.get_tag_versions(tag_versions) == tag_versions:
+                self.stats['hits'] += 1
+                return value
+        self.stats['misses'] += 1
+        return default
+
+    def set(self, key, value, ttl=None, tags=()):
+        tag_versions = self.get_tag_versions(tags) if tags else {}
+        self.store(key, (value, tag_versions), self.default_ttl if ttl is None else ttl)
+
+    def delete(self, key):
+        self.remove(key)
+
+    def invalidate_tag(self, tag):
+        """Make every entry stored with this tag stale."""
+        self.incr(f'tag:{tag}')
+
+    def get_tag_versions(self, tags):
+        tags = sorted(tags)
+        return dict(zip(tags, self.load_counters([f'tag:{tag}' for tag in tags])))
+
+    def get_or_set(self, key, create, ttl=None, tags=()):
+        """Cached value of key, calling create() to compute and store it on a miss.
+
+        Only one caller at a time computes a missing value, others wait for its result instead of stampeding:
+        threads of this process through a local lock, processes sharing the backend through a lock entry.
+        """
+        value = self.get(key, self.MISS)
+        if value is not self.MISS:
+            return value
+        with self.local_locks[hash(key) % len(self.local_locks)]:
+            value = self.get(key, self.MISS)
+            if value is not self.MISS:
+                return value
+            lock_key = f'lock:{key}'
+            deadline = time.monotonic() + self.lock_timeout
+            locked = self.acquire(lock_key, self.lock_timeout)
+            while not locked and time.monotonic() < deadline:
+                time.sleep(0.05)
+                value = self.get(key, self.MISS)
+                if value is not self.MISS:
+                    return value
+                locked = self.acquire(lock_key, self.lock_timeout)
+            try:
+                value = create()
+                self.set(key, value, ttl, tags)
+            finally:
+                if locked:
+                    self.remove(lock_key)
+            return value
+
+    def get_stats(self):
+        lookups = self.stats['hits'] + self.stats['misses']
+        return {
+            'backend': type(self).__name__,
+            'hits': self.stats['hits'],
+            'misses': self.stats['misses'],
+            'hit_rate': round(self.stats['hits'] / lookups, 3) if lookups else 0,
+        }
+
+
+class MemoryCache(Cache):
+    """Process local LRU cache backend."""
+
+    def __init__(self, max_entries, **kwargs):
+        super().__init__(**kwargs)
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        # tag versions are kept apart from the LRU entries, so they are never evicted
+        self.counters = Counter()
+
+    def load(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires and expires < time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def store(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (time.time() + ttl if ttl else 0, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def remove(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def incr(self, key):
+        with self.lock:
+            self.counters[key] += 1
+            return self.counters[key]
+
+    def load_counters(self, keys):
+        with self.lock:
+            return [self.counters[key] for key in keys]
+
+    def acquire(self, key, ttl):
+        # the local lock of get_or_set already covers everything sharing this cache
+        return True
+
+
+class FileSystemCache(Cache):
+    """Cache backend storing a file per key, shared by the workers of a host and kept across restarts.
+
+    Files hold the expiry timestamp followed by the pickled value, and are read through mmap. Expired files
+    are removed when read, files of keys never read again can be cleaned up by age (see README).
+    """
+    header = struct.Struct('d')
+
+    def __init__(self, cache_dir, **kwargs):
+        super().__init__(**kwargs)
+        self.cache_dir = os.path.abspath(cache_dir)
+        os.makedirs(os.path.join(self.cache_dir, 'tags'), exist_ok=True)
+
+    def get_path(self, key):
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode()).hexdigest())
+
+    def load(self, key):
+        path = self.get_path(key)
+        try:
+            with open(path, 'rb') as cache_file, mmap.mmap(cache_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                expires, = self.header.unpack_from(data)
+                if not expires or expires >= time.time():
+                    return pickle.loads(data[self.header.size:])
+        except (OSError, ValueError, EOFError, pickle.UnpicklingError, struct.error):
+            return None
+        self.remove(key)
+        return None
+
+    def store(self, key, value, ttl):
+        path = self.get_path(key)
+        # write under a temporary name first, so readers never see a partial file
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'wb') as cache_file:
+            cache_file.write(self.header.pack(time.time() + ttl if ttl else 0))
+            pickle.dump(value, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def remove(self, key):
+        try:
+            os.remove(self.get_path(key))
+        except FileNotFoundError:
+            pass
+
+    def get_counter_path(self, key):
+        return os.path.join(self.cache_dir, 'tags', hashlib.sha1(key.encode()).hexdigest())
+
+    def incr(self, key):
+        with open(self.get_counter_path(key), 'a+') as counter_file:
+            fcntl.flock(counter_file, fcntl.LOCK_EX)
+            counter_file.seek(0)
+            counter = int(counter_file.read() or 0) + 1
+            counter_file.seek(0)
+            counter_file.truncate()
+            counter_file.write(str(counter))
+            return counter
+
+    def load_counters(self, keys):
+        counters = []
+        for key in keys:
+            try:
+                with open(self.get_counter_path(key)) as counter_file:
+                    counters.append(int(counter_file.read() or 0))
+            except FileNotFoundError:
+                counters.append(0)
+        return counters
+
+    def acquire(self, key, ttl):
+        path = self.get_path(key)
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            # lock left behind by a worker which died while computing
+            try:
+                if os.path.getmtime(path) < time.time() - ttl:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+            return False
+
+
+class RedisCache(Cache):
+    """Cache backend for any Redis protocol server, shared by every worker and host. Needs the redis package.
+
+    The server is an optimization, so failed reads are treated as misses and failed writes are logged and skipped.
+    """
+
+    def __init__(self, url, key_prefix='ml:', **kwargs):
+        super().__init__(**kwargs)
+        # optional dependency, only needed with CACHE_BACKEND=redis
+        import redis
+        self.error = redis.RedisError
+        self.client = redis.Redis.from_url(url)
+        self.key_prefix = key_prefix
+
+    def load(self, key):
+        try:
+            data = self.client.get(self.key_prefix + key)
+        except self.error as err:
+            logger.warning(f'Cache read failed:\t{err}')
+            return None
+        return pickle.loads(data) if data is not None else None
+
+    def store(self, key, value, ttl):
+        try:
+            self.client.set(self.key_prefix + key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), ex=ttl or None)
+        except self.error as err:
+            logger.warning(f'Cache write failed:\t{err}')
+
+    def remove(self, key):
+        try:
+            self.client.delete(self.key_prefix + key)
+        except self.error as err:
+            logger.warning(f'Cache delete failed:\t{err}')
+
+    def incr(self, key):
+        try:
+            return self.client.incr(self.key_prefix + key)
+        except self.error as err:
+            logger.warning(f'Cache tag invalidation failed:\t{err}')
+            return 0
+
+    def load_counters(self, keys):
+        try:
+            return [int(counter or 0) for counter in self.client.mget([self.key_prefix + key for key in keys])]
+        except self.error as err:
+            # as if never invalidated, the entries themselves cannot be read either
+            logger.warning(f'Cache read failed:\t{err}')
+            return [0] * len(keys)
+
+    def acquire(self, key, ttl):
+        try:
+            return bool(self.client.set(self.key_prefix + key, b'1', nx=True, ex=ttl))
+        except self.error as err:
+            # compute the value without the lock, rather than waiting for a server which is down
+            logger.warning(f'Cache lock failed:\t{err}')
+            return True
+
+
+cache_options = {'default_ttl': Config.CACHE_DEFAULT_TTL, 'lock_timeout': Config.CACHE_LOCK_TIMEOUT}
+if Config.CACHE_BACKEND == 'redis':
+    cache = RedisCache(Config.CACHE_REDIS_URL, **cache_options)
+elif Config.CACHE_BACKEND == 'filesystem':
+    cache = FileSystemCache(Config.CACHE_DIR, **cache_options)
+else:
+    cache = MemoryCache(Config.CACHE_MEMORY_SIZE, **cache_options)
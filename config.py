@@ -0,0 +1,111 @@
+"""Music League settings, read from the environment (and .flaskenv)."""
+import os
+
+from dotenv import load_dotenv
+
+
+class Config(object):
+    load_dotenv('.flaskenv')
+    SECRET_KEY = os.environ.get('SECRET_KEY')
+    DB_USER = os.environ.get('PG_USER')
+    DB_PASSWD = os.environ.get('PG_PASSWD')
+    DB_NAME = os.environ.get('DB_NAME')
+    DB_HOST = os.environ.get('DB_HOST') or 'localhost'
+    DB_PORT = int(os.environ.get('DB_PORT') or 5432)
+    DB_URL = os.environ.get('DB_URL') or f'postgresql://{DB_USER}:{DB_PASSWD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 6)
+    # connections opened beyond the pool when it is exhausted (and closed again), per worker and database
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW') or 0)
+    # optional read-only replica, used by read-only views
+    DB_REPLICA_URL = os.environ.get('DB_REPLICA_URL')
+    DB_REPLICA_POOL_SIZE = int(os.environ.get('DB_REPLICA_POOL_SIZE') or DB_POOL_SIZE)
+    # seconds after a user's last write during which their reads stay on the primary
+    REPLICA_LAG_SECONDS = int(os.environ.get('REPLICA_LAG_SECONDS') or 10)
+    db_engine_options = {'pool_pre_ping': True, 'pool_size': DB_POOL_SIZE, 'max_overflow': DB_MAX_OVERFLOW, 'pool_recycle': 3600}
+    SQLALCHEMY_DATABASE_URI = DB_URL
+    SQLALCHEMY_ENGINE_OPTIONS = db_engine_options
+    SQLALCHEMY_BINDS = {'replica': {'url': DB_REPLICA_URL, 'pool_size': DB_REPLICA_POOL_SIZE, 'max_overflow': DB_MAX_OVERFLOW}} if DB_REPLICA_URL else {}
+    MAIL_SERVER = os.environ.get('MAIL_SERVER')
+    MAIL_PORT = int(os.environ.get('MAIL_PORT') or 25)
+    MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS') is not None
+    MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
+    MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
+    ADMINS = [os.environ.get('ADMIN_EMAIL')]
+    # digest users get their round notices of this many minutes in one email, 0 sends one digest per send_notices.py run
+    NOTIFY_DIGEST_WINDOW_MINUTES = int(os.environ.get('NOTIFY_DIGEST_WINDOW_MINUTES') or 0)
+    LEAGUES_PER_PAGE = 9
+    SONGS_PER_PAGE = 10
+    # front page songs are picked from a cached pool of random songs
+    FEATURED_SONGS = 4
+    FEATURED_POOL_SIZE = 100
+    USERS_PER_PAGE = 20
+    LEADERBOARD_TOP_SONGS = 10
+    # similar voters and favourite submitters listed per member on the league analytics page
+    ANALYTICS_TOP_N = 5
+    SEARCH_RESULTS_LIMIT = 20
+    # live round progress via server-sent events, needs an async (gevent) gunicorn worker class
+    ROUND_PROGRESS_EVENTS = os.environ.get('ROUND_PROGRESS_EVENTS') is not None
+    ROUND_PROGRESS_MAX_SECONDS = 300
+    ROUND_PROGRESS_KEEPALIVE_SECONDS = 15
+    # songs are accepted right away, youtube details are fetched by background threads
+    YT_ENRICH_WORKERS = 2
+    YT_ENRICH_MAX_ATTEMPTS = 5
+    # song thumbnails are fetched once, resized and served from a local cache
+    THUMBNAIL_CACHE_DIR = os.environ.get('THUMBNAIL_CACHE_DIR') or 'cache/thumbnails'
+    THUMBNAIL_SOURCE_URL = os.environ.get('THUMBNAIL_SOURCE_URL') or 'https://i.ytimg.com/vi/{video_id}/default.jpg'
+    THUMBNAIL_SIZE = (80, 60)
+    THUMBNAIL_FETCH_TIMEOUT = 5
+    THUMBNAIL_MAX_AGE = 31536000
+    # shared cache backend: memory (per process LRU), filesystem (shared by the workers of a host) or redis
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND') or 'memory'
+    CACHE_DIR = os.environ.get('CACHE_DIR') or 'cache/data'
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL') or 'redis://localhost:6379/0'
+    CACHE_MEMORY_SIZE = int(os.environ.get('CACHE_MEMORY_SIZE') or 2000)
+    CACHE_DEFAULT_TTL = 3600
+    # seconds to wait for another worker computing the same value, before computing it anyway
+    CACHE_LOCK_TIMEOUT = 10
+    CACHE_IMAGE_TTL = 86400
+    CACHE_YT_TTL = 86400
+    CACHE_LEADERBOARD_TTL = 600
+    # league analytics are also invalidated whenever one of the league's rounds is finalized
+    CACHE_ANALYTICS_TTL = 86400
+    CACHE_FEATURED_TTL = 300
+    # seconds rendered template fragments are cached, 0 disables the fragment cache
+    FRAGMENT_CACHE_TTL = int(os.environ.get('FRAGMENT_CACHE_TTL') or 86400)
+    # responses smaller than this many bytes are sent uncompressed
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE') or 500)
+    COMPRESS_MIMETYPES = ['text/html', 'text/css', 'text/plain', 'text/csv', 'application/json', 'application/x-ndjson', 'application/javascript', 'text/javascript', 'image/svg+xml']
+    # static urls carry a content hash, so browsers can keep them until the file changes
+    STATIC_MAX_AGE = 31536000
+    # pages kept on members' devices by the service worker (sw.js), shown right away and revalidated in the background
+    CLIENT_CACHE_ENDPOINTS = ['league', 'round_', 'standings', 'round_votes']
+    CLIENT_CACHE_PAGES = int(os.environ.get('CLIENT_CACHE_PAGES') or 50)
+    # seconds the pages of ended rounds, which no longer change, are shown from the device without revalidating
+    CLIENT_CACHE_ENDED_MAX_AGE = int(os.environ.get('CLIENT_CACHE_ENDED_MAX_AGE') or 86400)
+    YT_API_KEY = os.environ.get('YT_API_KEY')
+    APP_WEB_PATH = os.environ.get('APP_WEB_PATH')
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH'))
+    UPLOAD_EXTENSIONS = ['.jpg', '.png']
+    LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES') or 10485760)
+    LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT') or 10)
+    # minimum seconds between error emails, errors in between are batched into the next email
+    LOG_MAIL_INTERVAL = int(os.environ.get('LOG_MAIL_INTERVAL') or 300)
+    # requests slower than this are logged as warnings
+    LOG_SLOW_REQUEST_MS = int(os.environ.get('LOG_SLOW_REQUEST_MS') or 2000)
+    # count the database queries of each request: off, log (warn about budget violations and N+1 queries) or raise (fail the request)
+    QUERY_BUDGET_MODE = os.environ.get('QUERY_BUDGET_MODE') or 'off'
+    # most queries a request may run, unless its endpoint has its own budget below
+    QUERY_BUDGET = int(os.environ.get('QUERY_BUDGET') or 10)
+    QUERY_BUDGETS = {'default': 4, 'leagues': 4, 'leaderboard': 4, 'leaderboard_api': 4}
+    # the same statement run this many times within a request is reported as an N+1 query
+    QUERY_REPEAT_THRESHOLD = int(os.environ.get('QUERY_REPEAT_THRESHOLD') or 5)
+    # sampling profiles of requests, asked for by admins or a random fraction (0 to 1) of all requests, browsable at /admin/profiles
+    PROFILE_DIR = os.environ.get('PROFILE_DIR') or 'profiles'
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE') or 0)
+    PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS') or 1)
+    PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP') or 100)
+    PROFILE_TOP_FUNCTIONS = 30
+    # finished leagues are moved to the archive tables this many days after they end
+    ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS') or 180)
+    EXPORT_BATCH_SIZE = 500
+    IMPORT_BATCH_SIZE = 1000
@@ -0,0 +1,72 @@
+"""gunicorn settings for the music league web app: gunicorn -c gunicorn.conf.py run:app
+
+The app (and its compiled templates) is loaded once by the master process (preload_app), and the forked
+workers share that memory copy-on-write, instead of each importing everything again.
+Each worker then gets its own database connections and logging thread (see musicleague.after_fork).
+
+Sizing, all of which can be set from the environment:
+* GUNICORN_WORKERS (default 2 per CPU): each worker keeps up to DB_POOL_SIZE database connections open, opens up to
+  DB_MAX_OVERFLOW (default 0) more when they are all busy, and holds one listening for round progress, so
+  workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW + 1) must stay below the postgres max_connections. With a replica,
+  workers * (DB_REPLICA_POOL_SIZE + DB_MAX_OVERFLOW) must stay below the replica's max_connections.
+* GUNICORN_THREADS (default 4): concurrent requests per gthread worker, at most DB_POOL_SIZE as every busy
+  thread may hold a database connection.
+* GUNICORN_WORKER_CLASS: gthread, or gevent when ROUND_PROGRESS_EVENTS is enabled, as every open event
+  stream would keep a thread busy. Database queries are made cooperative with psycogreen then.
+* GUNICORN_WARM_UP (default 1): set to 0 to skip filling the caches before the workers are forked.
+"""
+import multiprocessing
+import os
+
+
+bind = os.environ.get('GUNICORN_BIND') or 'localhost:5000'
+workers = int(os.environ.get('GUNICORN_WORKERS') or multiprocessing.cpu_count() * 2)
+threads = int(os.environ.get('GUNICORN_THREADS') or 4)
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS') or ('gevent' if os.environ.get('ROUND_PROGRESS_EVENTS') else 'gthread')
+preload_app = True
+proc_name = 'musicleague'
+
+if worker_class == 'gevent':
+    # patch before the app is preloaded, otherwise the app's locks and sockets are created unpatched
+    from gevent import monkey
+    monkey.patch_all()
+    # psycopg2 is a C extension which monkey patching does not reach, without this every query blocks the whole worker
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
+
+
+def memory_usage(pid='self'):
+    """Resident, proportional (shared pages split between the processes using them) and shared memory of a process."""
+    usage = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as smaps:
+            for line in smaps:
+                key, _, value = line.partition(':')
+                if key in ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty'):
+                    usage[key] = int(value.split()[0]) / 1024
+    except (OSError, ValueError):
+        # not linux
+        return 'unknown'
+    return f"rss {usage['Rss']:.1f} MiB, pss {usage['Pss']:.1f} MiB, shared {usage['Shared_Clean'] + usage['Shared_Dirty']:.1f} MiB"
+
+
+def when_ready(server):
+    # runs in the master, after the app is preloaded and before any worker is forked
+    import musicleague
+    server.log.info(f'Precompiled {musicleague.precompile_templates()} templates')
+    if os.environ.get('GUNICORN_WARM_UP', '1') != '0':
+        server.log.info(f'Warmed up caches, including {musicleague.warm_up()} running leagues')
+    server.log.info(f'Master memory: {memory_usage()}')
+
+
+def post_fork(server, worker):
+    import musicleague
+    musicleague.after_fork()
+
+
+def post_worker_init(worker):
+    worker.log.info(f'Worker {worker.pid} memory before serving: {memory_usage()}')
+
+
+def worker_exit(server, worker):
+    server.log.info(f'Worker {worker.pid} memory after serving: {memory_usage()}')
@@ -18,6 +18,9 @@ SET row_security = off;
 
 SET default_tablespace = '';
 
+-- trigram indexes, used for fuzzy search
+CREATE EXTENSION IF NOT EXISTS pg_trgm WITH SCHEMA public;
+
 SET default_table_access_method = heap;
 
 --
@@ -54,7 +57,7 @@ ALTER TABLE public.icons_id_seq OWNER TO ml;
 
 ALTER SEQUENCE public.icons_id_seq OWNED BY public.icons.id;
 
-CREATE unique index icons_user_id ON icons(user_id);
+CREATE unique index icons_user_id ON public.icons(user_id);
 --
 -- Name: league_members; Type: TABLE; Schema: public; Owner: ml
 --
@@ -89,7 +92,7 @@ ALTER TABLE public.league_members_id_seq OWNER TO ml;
 
 ALTER SEQUENCE public.league_members_id_seq OWNED BY public.league_members.id;
 
-CREATE unique index user_league_id ON league_members(league_id, user_id);
+CREATE unique index user_league_id ON public.league_members(league_id, user_id);
 
 --
 -- Name: leagues; Type: TABLE; Schema: public; Owner: ml
@@ -106,11 +109,18 @@ CREATE TABLE public.leagues (
     downvotes integer DEFAULT 0 NOT NULL,
     owner_id integer NOT NULL,
     round_count integer DEFAULT 1 NOT NULL,
+    version integer DEFAULT 1 NOT NULL,
+    archived boolean DEFAULT 'false' NOT NULL,
+    member_count integer DEFAULT 0 NOT NULL,
+    rounds_finished integer DEFAULT 0 NOT NULL,
+    search_vector tsvector GENERATED ALWAYS AS (to_tsvector('simple'::regconfig, coalesce(name, '') || ' ' || coalesce(descr, ''))) STORED,
     CONSTRAINT positive_round_cnt CHECK ((round_count > 0))
 );
 
 
 ALTER TABLE public.leagues OWNER TO ml;
+CREATE index leagues_search_vector ON public.leagues USING gin (search_vector);
+CREATE index leagues_name_trgm ON public.leagues USING gin (name public.gin_trgm_ops);
 
 --
 -- Name: leagues_id_seq; Type: SEQUENCE; Schema: public; Owner: ml
@@ -143,14 +153,25 @@ CREATE TABLE public.rounds (
     league_id integer NOT NULL,
     name text NOT NULL,
     descr text NOT NULL,
+    submit_start timestamp without time zone NOT NULL,
+    vote_start timestamp without time zone NOT NULL,
     end_date timestamp without time zone DEFAULT now() NOT NULL,
-    submit_email boolean DEFAULT 'false' NOT NULL
-    vote_email boolean DEFAULT 'false' NOT NULL
-    end_email boolean DEFAULT 'false' NOT NULL
+    submit_email boolean DEFAULT 'false' NOT NULL,
+    vote_email boolean DEFAULT 'false' NOT NULL,
+    end_email boolean DEFAULT 'false' NOT NULL,
+    finalized boolean DEFAULT 'false' NOT NULL,
+    song_count integer DEFAULT 0 NOT NULL,
+    ballot_count integer DEFAULT 0 NOT NULL,
+    search_vector tsvector GENERATED ALWAYS AS (to_tsvector('simple'::regconfig, coalesce(name, '') || ' ' || coalesce(descr, ''))) STORED
 );
 
 
 ALTER TABLE public.rounds OWNER TO ml;
+CREATE index rounds_submit_start ON public.rounds(submit_start);
+CREATE index rounds_vote_start ON public.rounds(vote_start);
+CREATE index rounds_end_date ON public.rounds(end_date);
+CREATE index rounds_search_vector ON public.rounds USING gin (search_vector);
+CREATE index rounds_name_trgm ON public.rounds USING gin (name public.gin_trgm_ops);
 
 --
 -- Name: rounds_id_seq; Type: SEQUENCE; Schema: public; Owner: ml
@@ -187,11 +208,19 @@ CREATE TABLE public.songs (
     user_id integer NOT NULL,
     title text NOT NULL,
     thumbnail text NOT NULL,
-    video_id text NOT NULL
+    video_id text NOT NULL,
+    metadata_status text DEFAULT 'done' NOT NULL,
+    metadata_attempts integer DEFAULT 0 NOT NULL,
+    search_vector tsvector GENERATED ALWAYS AS (to_tsvector('simple'::regconfig, coalesce(title, '') || ' ' || coalesce(descr, ''))) STORED
 );
 
 
 ALTER TABLE public.songs OWNER TO ml;
+CREATE index songs_search_vector ON public.songs USING gin (search_vector);
+CREATE index songs_title_trgm ON public.songs USING gin (title public.gin_trgm_ops);
+CREATE index songs_league_id_video_id ON public.songs(league_id, video_id);
+CREATE index songs_video_id ON public.songs(video_id);
+CREATE index songs_metadata_pending ON public.songs(id) WHERE metadata_status = 'pending';
 
 --
 -- Name: songs_id_seq; Type: SEQUENCE; Schema: public; Owner: ml
@@ -227,7 +256,8 @@ CREATE TABLE public.users (
     name text NOT NULL,
     active boolean DEFAULT true NOT NULL,
     icon_id integer,
-    last_login date DEFAULT now() NOT NULL
+    last_login date DEFAULT now() NOT NULL,
+    notify_mode text DEFAULT 'digest'::text NOT NULL
 );
 
 
@@ -520,6 +550,107 @@ GRANT ALL ON SEQUENCE public.league_members_id_seq TO ml;
 -- foreign key between users and icons
 ALTER TABLE ONLY public.icons
     ADD CONSTRAINT fk_user_id FOREIGN KEY (user_id) REFERENCES public.users(id);
+
+--
+-- Name: round_results; Type: TABLE; Schema: public; Owner: ml
+-- final points and placement of each song, written once when its round is finalized
+--
+
+CREATE TABLE public.round_results (
+    id serial PRIMARY KEY,
+    round_id integer NOT NULL REFERENCES public.rounds(id),
+    league_id integer NOT NULL REFERENCES public.leagues(id),
+    song_id integer NOT NULL UNIQUE,
+    user_id integer NOT NULL REFERENCES public.users(id),
+    points integer DEFAULT 0 NOT NULL,
+    placement integer NOT NULL,
+    title text NOT NULL,
+    song_url text NOT NULL,
+    video_id text NOT NULL
+);
+
+ALTER TABLE public.round_results OWNER TO ml;
+CREATE index round_results_points ON public.round_results(points DESC);
+CREATE index round_results_round_id ON public.round_results(round_id);
+
+--
+-- Name: user_stats; Type: TABLE; Schema: public; Owner: ml
+-- all-time per user rollup of round_results, for the leaderboard
+--
+
+CREATE TABLE public.user_stats (
+    user_id integer PRIMARY KEY REFERENCES public.users(id),
+    total_points integer DEFAULT 0 NOT NULL,
+    wins integer DEFAULT 0 NOT NULL,
+    rounds_played integer DEFAULT 0 NOT NULL,
+    placement_total integer DEFAULT 0 NOT NULL
+);
+
+ALTER TABLE public.user_stats OWNER TO ml;
+CREATE index user_stats_total_points ON public.user_stats(total_points DESC, user_id);
+
+--
+-- Name: league_members_archive, songs_archive, votes_archive; Type: TABLE; Schema: public; Owner: ml
+-- rows of archived leagues, moved out of the active tables by 'flask archive-leagues'
+--
+
+CREATE TABLE public.league_members_archive (
+    id integer PRIMARY KEY,
+    league_id integer NOT NULL REFERENCES public.leagues(id),
+    user_id integer NOT NULL REFERENCES public.users(id)
+);
+
+ALTER TABLE public.league_members_archive OWNER TO ml;
+CREATE index league_members_archive_league_id ON public.league_members_archive(league_id);
+
+CREATE TABLE public.songs_archive (
+    id integer PRIMARY KEY,
+    league_id integer NOT NULL REFERENCES public.leagues(id),
+    song_url text NOT NULL,
+    descr text,
+    round_id integer NOT NULL REFERENCES public.rounds(id),
+    user_id integer NOT NULL REFERENCES public.users(id),
+    title text NOT NULL,
+    thumbnail text NOT NULL,
+    video_id text NOT NULL
+);
+
+ALTER TABLE public.songs_archive OWNER TO ml;
+CREATE index songs_archive_round_id ON public.songs_archive(round_id);
+CREATE index songs_archive_league_id ON public.songs_archive(league_id);
+CREATE index songs_archive_video_id ON public.songs_archive(video_id);
+
+CREATE TABLE public.votes_archive (
+    id integer PRIMARY KEY,
+    song_id integer NOT NULL REFERENCES public.songs_archive(id),
+    league_id integer NOT NULL REFERENCES public.leagues(id),
+    user_id integer NOT NULL REFERENCES public.users(id),
+    votes integer DEFAULT 0 NOT NULL,
+    comment text,
+    vote_date timestamp without time zone NOT NULL,
+    round_id integer NOT NULL REFERENCES public.rounds(id)
+);
+
+ALTER TABLE public.votes_archive OWNER TO ml;
+CREATE index votes_archive_round_id ON public.votes_archive(round_id);
+CREATE index votes_archive_league_id ON public.votes_archive(league_id);
+
+--
+-- Name: pending_notices; Type: TABLE; Schema: public; Owner: ml
+-- round notices waiting to be sent in a digest email, when NOTIFY_DIGEST_WINDOW_MINUTES is set
+--
+
+CREATE TABLE public.pending_notices (
+    id serial PRIMARY KEY,
+    user_id integer NOT NULL REFERENCES public.users(id),
+    round_id integer NOT NULL REFERENCES public.rounds(id),
+    status integer NOT NULL,
+    created timestamp without time zone DEFAULT now() NOT NULL
+);
+
+ALTER TABLE public.pending_notices OWNER TO ml;
+CREATE index pending_notices_user_id ON public.pending_notices(user_id);
+
 --
 -- PostgreSQL database dump complete
 --
@@ -0,0 +1,131 @@
+--
+-- Schema changes for databases created from an older ml.sql
+-- Every statement is safe to re-run, apply with: psql -f ml_upgrade.sql
+--
+
+-- all-time leaderboard rollups
+ALTER TABLE public.rounds ADD COLUMN IF NOT EXISTS finalized boolean DEFAULT 'false' NOT NULL;
+CREATE TABLE IF NOT EXISTS public.round_results (
+    id serial PRIMARY KEY,
+    round_id integer NOT NULL REFERENCES public.rounds(id),
+    league_id integer NOT NULL REFERENCES public.leagues(id),
+    song_id integer NOT NULL UNIQUE REFERENCES public.songs(id),
+    user_id integer NOT NULL REFERENCES public.users(id),
+    points integer DEFAULT 0 NOT NULL,
+    placement integer NOT NULL
+);
+CREATE INDEX IF NOT EXISTS round_results_points ON round_results(points DESC);
+CREATE INDEX IF NOT EXISTS round_results_round_id ON round_results(round_id);
+CREATE TABLE IF NOT EXISTS public.user_stats (
+    user_id integer PRIMARY KEY REFERENCES public.users(id),
+    total_points integer DEFAULT 0 NOT NULL,
+    wins integer DEFAULT 0 NOT NULL,
+    rounds_played integer DEFAULT 0 NOT NULL,
+    placement_total integer DEFAULT 0 NOT NULL
+);
+CREATE INDEX IF NOT EXISTS user_stats_total_points ON user_stats(total_points DESC, user_id);
+
+-- stored round phase boundaries
+ALTER TABLE public.rounds ADD COLUMN IF NOT EXISTS submit_start timestamp without time zone;
+ALTER TABLE public.rounds ADD COLUMN IF NOT EXISTS vote_start timestamp without time zone;
+UPDATE public.rounds r SET
+    vote_start = r.end_date - make_interval(days => l.vote_days),
+    submit_start = r.end_date - make_interval(days => l.vote_days + l.submit_days)
+    FROM public.leagues l WHERE l.id = r.league_id AND r.submit_start IS NULL;
+ALTER TABLE public.rounds ALTER COLUMN submit_start SET NOT NULL;
+ALTER TABLE public.rounds ALTER COLUMN vote_start SET NOT NULL;
+CREATE INDEX IF NOT EXISTS rounds_submit_start ON rounds(submit_start);
+CREATE INDEX IF NOT EXISTS rounds_vote_start ON rounds(vote_start);
+CREATE INDEX IF NOT EXISTS rounds_end_date ON rounds(end_date);
+
+-- full text and trigram search
+CREATE EXTENSION IF NOT EXISTS pg_trgm WITH SCHEMA public;
+ALTER TABLE public.songs ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (to_tsvector('simple'::regconfig, coalesce(title, '') || ' ' || coalesce(descr, ''))) STORED;
+ALTER TABLE public.leagues ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (to_tsvector('simple'::regconfig, coalesce(name, '') || ' ' || coalesce(descr, ''))) STORED;
+ALTER TABLE public.rounds ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (to_tsvector('simple'::regconfig, coalesce(name, '') || ' ' || coalesce(descr, ''))) STORED;
+CREATE INDEX IF NOT EXISTS songs_search_vector ON public.songs USING gin (search_vector);
+CREATE INDEX IF NOT EXISTS songs_title_trgm ON public.songs USING gin (title public.gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS songs_league_id_video_id ON public.songs(league_id, video_id);
+CREATE INDEX IF NOT EXISTS leagues_search_vector ON public.leagues USING gin (search_vector);
+CREATE INDEX IF NOT EXISTS leagues_name_trgm ON public.leagues USING gin (name public.gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS rounds_search_vector ON public.rounds USING gin (search_vector);
+CREATE INDEX IF NOT EXISTS rounds_name_trgm ON public.rounds USING gin (name public.gin_trgm_ops);
+
+-- league page fragment cache version
+ALTER TABLE public.leagues ADD COLUMN IF NOT EXISTS version integer DEFAULT 1 NOT NULL;
+
+-- deferred youtube details for submitted songs
+ALTER TABLE public.songs ADD COLUMN IF NOT EXISTS metadata_status text DEFAULT 'done' NOT NULL;
+ALTER TABLE public.songs ADD COLUMN IF NOT EXISTS metadata_attempts integer DEFAULT 0 NOT NULL;
+CREATE INDEX IF NOT EXISTS songs_metadata_pending ON public.songs(id) WHERE metadata_status = 'pending';
+
+-- archival of finished leagues, round results no longer depend on the songs table
+ALTER TABLE public.leagues ADD COLUMN IF NOT EXISTS archived boolean DEFAULT 'false' NOT NULL;
+ALTER TABLE public.round_results DROP CONSTRAINT IF EXISTS round_results_song_id_fkey;
+ALTER TABLE public.round_results ADD COLUMN IF NOT EXISTS title text;
+ALTER TABLE public.round_results ADD COLUMN IF NOT EXISTS song_url text;
+ALTER TABLE public.round_results ADD COLUMN IF NOT EXISTS video_id text;
+UPDATE public.round_results r SET title = s.title, song_url = s.song_url, video_id = s.video_id
+    FROM public.songs s WHERE s.id = r.song_id AND r.title IS NULL;
+ALTER TABLE public.round_results ALTER COLUMN title SET NOT NULL;
+ALTER TABLE public.round_results ALTER COLUMN song_url SET NOT NULL;
+ALTER TABLE public.round_results ALTER COLUMN video_id SET NOT NULL;
+CREATE TABLE IF NOT EXISTS public.league_members_archive (
+    id integer PRIMARY KEY,
+    league_id integer NOT NULL REFERENCES public.leagues(id),
+    user_id integer NOT NULL REFERENCES public.users(id)
+);
+CREATE INDEX IF NOT EXISTS league_members_archive_league_id ON public.league_members_archive(league_id);
+CREATE TABLE IF NOT EXISTS public.songs_archive (
+    id integer PRIMARY KEY,
+    league_id integer NOT NULL REFERENCES public.leagues(id),
+    song_url text NOT NULL,
+    descr text,
+    round_id integer NOT NULL REFERENCES public.rounds(id),
+    user_id integer NOT NULL REFERENCES public.users(id),
+    title text NOT NULL,
+    thumbnail text NOT NULL,
+    video_id text NOT NULL
+);
+CREATE INDEX IF NOT EXISTS songs_archive_round_id ON public.songs_archive(round_id);
+CREATE INDEX IF NOT EXISTS songs_archive_league_id ON public.songs_archive(league_id);
+CREATE TABLE IF NOT EXISTS public.votes_archive (
+    id integer PRIMARY KEY,
+    song_id integer NOT NULL REFERENCES public.songs_archive(id),
+    league_id integer NOT NULL REFERENCES public.leagues(id),
+    user_id integer NOT NULL REFERENCES public.users(id),
+    votes integer DEFAULT 0 NOT NULL,
+    comment text,
+    vote_date timestamp without time zone NOT NULL,
+    round_id integer NOT NULL REFERENCES public.rounds(id)
+);
+CREATE INDEX IF NOT EXISTS votes_archive_round_id ON public.votes_archive(round_id);
+CREATE INDEX IF NOT EXISTS votes_archive_league_id ON public.votes_archive(league_id);
+
+-- stored member, finished round, song and ballot counters, fill them in afterwards with: flask repair-counters
+ALTER TABLE public.leagues ADD COLUMN IF NOT EXISTS member_count integer DEFAULT 0 NOT NULL;
+ALTER TABLE public.leagues ADD COLUMN IF NOT EXISTS rounds_finished integer DEFAULT 0 NOT NULL;
+ALTER TABLE public.rounds ADD COLUMN IF NOT EXISTS song_count integer DEFAULT 0 NOT NULL;
+ALTER TABLE public.rounds ADD COLUMN IF NOT EXISTS ballot_count integer DEFAULT 0 NOT NULL;
+
+-- per user notification mode, and round notices waiting for the next digest email
+ALTER TABLE public.users ADD COLUMN IF NOT EXISTS notify_mode text DEFAULT 'digest' NOT NULL;
+CREATE TABLE IF NOT EXISTS public.pending_notices (
+    id serial PRIMARY KEY,
+    user_id integer NOT NULL REFERENCES public.users(id),
+    round_id integer NOT NULL REFERENCES public.rounds(id),
+    status integer NOT NULL,
+    created timestamp without time zone DEFAULT now() NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pending_notices_user_id ON public.pending_notices(user_id);
+
+-- thumbnails are only fetched for videos which were submitted as songs
+CREATE INDEX IF NOT EXISTS songs_video_id ON public.songs(video_id);
+CREATE INDEX IF NOT EXISTS songs_archive_video_id ON public.songs_archive(video_id);
+
+-- round results which copied a song's placeholder title, before its youtube details were fetched
+UPDATE public.round_results r SET title = s.title FROM public.songs s
+    WHERE s.id = r.song_id AND s.metadata_status = 'done' AND r.title <> s.title;
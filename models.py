@@ -0,0 +1,291 @@
+"""Database models, importable without the web app (used by cron jobs and workers)."""
+from datetime import datetime, timedelta
+
+from flask import current_app, g, has_app_context
+from flask_login import UserMixin
+from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class RoutingSession(Session):
+    """Session which sends reads to the replica database, when the current request has opted in with use_replica().
+
+    Writes (flushes and DML statements) always go to the primary, and once a request has written
+    anything, the rest of its queries stay on the primary too.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            if self._flushing or getattr(clause, 'is_dml', False):
+                g.db_wrote = True
+            elif g.get('use_replica') and not g.get('db_wrote'):
+                return self._db.engines['replica']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+class Users(UserMixin, db.Model):
+    __tablename__ = 'users'
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.Integer, unique=True)
+    email = db.Column(db.String(64), unique=True)
+    passwd = db.Column(db.String(128))
+    name = db.Column(db.String(128))
+    active = db.Column(db.Boolean, default=True)
+    icon_id = db.Column(db.Integer, db.ForeignKey('icons.id'), nullable=True)
+    last_login = db.Column(db.DateTime, default=datetime.utcnow)
+    # round notification emails: digest (one email per send_notices.py run or NOTIFY_DIGEST_WINDOW_MINUTES) or immediate (one per round)
+    notify_mode = db.Column(db.String(16), default='digest')
+    icons = db.relationship('Icons', back_populates='user')
+    leagues = db.relationship('Leagues', back_populates='user')
+    members = db.relationship('LeagueMembers', back_populates='user')
+    songs = db.relationship('Songs', back_populates='user')
+    votes = db.relationship('Votes', back_populates='user')
+
+    def __repr__(self):
+        return f'<User {self.username}>'
+
+    def set_password(self, passwd):
+        self.passwd = generate_password_hash(passwd)
+
+    def check_password(self, passwd):
+        return check_password_hash(self.passwd, passwd)
+
+
+class Icons(UserMixin, db.Model):
+    __tablename__ = 'icons'
+    id = db.Column(db.Integer, primary_key=True)
+    icon = db.Column(db.LargeBinary, nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    user = db.relationship('Users', back_populates='icons')
+
+
+class Leagues(UserMixin, db.Model):
+    __tablename__ = 'leagues'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(128))
+    submit_days = db.Column(db.Integer)
+    vote_days = db.Column(db.Integer)
+    descr = db.Column(db.String(256), nullable=True)
+    end_date = db.Column(db.DateTime)
+    upvotes = db.Column(db.Integer, default=10)
+    downvotes = db.Column(db.Integer, default=0)
+    owner_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    round_count = db.Column(db.Integer, db.CheckConstraint('round_count > 0', name='positive_round_cnt'), default=1)
+    # bumped whenever members, rounds, songs or votes change, keys the cached league page fragments
+    version = db.Column(db.Integer, default=1)
+    # members, songs and votes have been moved to the archive tables
+    archived = db.Column(db.Boolean, default=False)
+    # stored counters, updated along with the rows they count ('flask repair-counters' recomputes them)
+    member_count = db.Column(db.Integer, default=0)
+    rounds_finished = db.Column(db.Integer, default=0)
+    search_vector = db.deferred(db.Column(TSVECTOR, db.Computed("to_tsvector('simple'::regconfig, coalesce(name, '') || ' ' || coalesce(descr, ''))")))
+    user = db.relationship('Users', back_populates='leagues')
+    members = db.relationship('LeagueMembers', back_populates='leagues')
+    rounds = db.relationship('Rounds', back_populates='leagues')
+    songs = db.relationship('Songs', back_populates='leagues')
+    votes = db.relationship('Votes', back_populates='leagues')
+
+    def __repr__(self):
+        return f'<Name {self.name}>'
+
+    def set_end_date(self, submit_days, vote_days, round_count):
+        now = datetime.utcnow()
+        total_days = (submit_days + vote_days) * round_count
+        end_date = now + timedelta(days=total_days)
+        current_app.logger.debug(f'now = {now}\tsubmit_days = {submit_days}\tround_count = {round_count}\tvote_days = {vote_days}\tend_date = {end_date}')
+        self.end_date = end_date
+
+
+class LeagueMembers(UserMixin, db.Model):
+    __tablename__ = 'league_members'
+    id = db.Column(db.Integer, primary_key=True)
+    league_id = db.Column(db.Integer, db.ForeignKey('leagues.id'))
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    user = db.relationship('Users', back_populates='members')
+    leagues = db.relationship('Leagues', back_populates='members')
+    __table_args__ = ( db.UniqueConstraint(league_id, user_id), )  # noqa: E201
+
+    def __repr__(self):
+        return f'<League Id {self.league_id}\tUser Id {self.user_id}>'
+
+
+class Rounds(UserMixin, db.Model):
+    __tablename__ = 'rounds'
+    id = db.Column(db.Integer, primary_key=True)
+    league_id = db.Column(db.Integer, db.ForeignKey('leagues.id'))
+    name = db.Column(db.String(92))
+    descr = db.Column(db.String(128))
+    submit_start = db.Column(db.DateTime, index=True)
+    vote_start = db.Column(db.DateTime, index=True)
+    end_date = db.Column(db.DateTime, index=True)
+    submit_email = db.Column(db.Boolean)
+    vote_email = db.Column(db.Boolean)
+    end_email = db.Column(db.Boolean)
+    finalized = db.Column(db.Boolean, default=False)
+    # stored counters of submitted songs and of members who voted, like the league counters
+    song_count = db.Column(db.Integer, default=0)
+    ballot_count = db.Column(db.Integer, default=0)
+    search_vector = db.deferred(db.Column(TSVECTOR, db.Computed("to_tsvector('simple'::regconfig, coalesce(name, '') || ' ' || coalesce(descr, ''))")))
+    leagues = db.relationship('Leagues', back_populates='rounds')
+    songs = db.relationship('Songs', back_populates='rounds')
+    votes = db.relationship('Votes', back_populates='rounds')
+    archived_songs = db.relationship('ArchivedSongs', back_populates='rounds')
+    archived_votes = db.relationship('ArchivedVotes', back_populates='rounds')
+
+    def __repr__(self):
+        return f'<Name {self.name}>'
+
+    def set_phase_dates(self, end_date, submit_days, vote_days):
+        self.end_date = end_date
+        self.vote_start = end_date - timedelta(days=vote_days)
+        self.submit_start = self.vote_start - timedelta(days=submit_days)
+
+
+class Songs(UserMixin, db.Model):
+    __tablename__ = 'songs'
+    id = db.Column(db.Integer, primary_key=True)
+    league_id = db.Column(db.Integer, db.ForeignKey('leagues.id'))
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    round_id = db.Column(db.Integer, db.ForeignKey('rounds.id'))
+    song_url = db.Column(db.String(512))
+    descr = db.Column(db.String(128), nullable=True)
+    video_id = db.Column(db.String(32))
+    title = db.Column(db.String(512))
+    thumbnail = db.Column(db.String(256))
+    # pending while title/thumbnail are placeholders awaiting the youtube API, then done (or failed)
+    metadata_status = db.Column(db.String(16), default='done')
+    metadata_attempts = db.Column(db.Integer, default=0)
+    search_vector = db.deferred(db.Column(TSVECTOR, db.Computed("to_tsvector('simple'::regconfig, coalesce(title, '') || ' ' || coalesce(descr, ''))")))
+    leagues = db.relationship('Leagues', back_populates='songs')
+    user = db.relationship('Users', back_populates='songs')
+    rounds = db.relationship('Rounds', back_populates='songs')
+    votes = db.relationship('Votes', back_populates='songs')
+
+    def __repr__(self):
+        return f'<Id {self.id}\tURL {self.song_url}>'
+
+
+class Votes(UserMixin, db.Model):
+    __tablename__ = 'votes'
+    id = db.Column(db.Integer, primary_key=True)
+    league_id = db.Column(db.Integer, db.ForeignKey('leagues.id'))
+    round_id = db.Column(db.Integer, db.ForeignKey('rounds.id'))
+    song_id = db.Column(db.Integer, db.ForeignKey('songs.id'))
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    votes = db.Column(db.Integer, default=0)
+    comment = db.Column(db.String(256), nullable=True)
+    vote_date = db.Column(db.DateTime, default=datetime.utcnow())
+    leagues = db.relationship('Leagues', back_populates='votes')
+    rounds = db.relationship('Rounds', back_populates='votes')
+    songs = db.relationship('Songs', back_populates='votes')
+    user = db.relationship('Users', back_populates='votes')
+
+    def __repr__(self):
+        return f'<Song Id {self.song_id}\tVotes {self.votes}>'
+
+
+class ArchivedLeagueMembers(UserMixin, db.Model):
+    __tablename__ = 'league_members_archive'
+    id = db.Column(db.Integer, primary_key=True)
+    league_id = db.Column(db.Integer, db.ForeignKey('leagues.id'))
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    user = db.relationship('Users')
+
+    def __repr__(self):
+        return f'<League Id {self.league_id}\tUser Id {self.user_id}>'
+
+
+class ArchivedSongs(UserMixin, db.Model):
+    __tablename__ = 'songs_archive'
+    id = db.Column(db.Integer, primary_key=True)
+    league_id = db.Column(db.Integer, db.ForeignKey('leagues.id'))
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    round_id = db.Column(db.Integer, db.ForeignKey('rounds.id'))
+    song_url = db.Column(db.String(512))
+    descr = db.Column(db.String(128), nullable=True)
+    video_id = db.Column(db.String(32))
+    title = db.Column(db.String(512))
+    thumbnail = db.Column(db.String(256))
+    user = db.relationship('Users')
+    rounds = db.relationship('Rounds', back_populates='archived_songs')
+    votes = db.relationship('ArchivedVotes', back_populates='songs')
+
+    def __repr__(self):
+        return f'<Id {self.id}\tURL {self.song_url}>'
+
+
+class ArchivedVotes(UserMixin, db.Model):
+    __tablename__ = 'votes_archive'
+    id = db.Column(db.Integer, primary_key=True)
+    league_id = db.Column(db.Integer, db.ForeignKey('leagues.id'))
+    round_id = db.Column(db.Integer, db.ForeignKey('rounds.id'))
+    song_id = db.Column(db.Integer, db.ForeignKey('songs_archive.id'))
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    votes = db.Column(db.Integer, default=0)
+    comment = db.Column(db.String(256), nullable=True)
+    vote_date = db.Column(db.DateTime)
+    rounds = db.relationship('Rounds', back_populates='archived_votes')
+    songs = db.relationship('ArchivedSongs', back_populates='votes')
+    user = db.relationship('Users')
+
+    def __repr__(self):
+        return f'<Song Id {self.song_id}\tVotes {self.votes}>'
+
+
+class RoundResults(UserMixin, db.Model):
+    __tablename__ = 'round_results'
+    id = db.Column(db.Integer, primary_key=True)
+    round_id = db.Column(db.Integer, db.ForeignKey('rounds.id'))
+    league_id = db.Column(db.Integer, db.ForeignKey('leagues.id'))
+    # no foreign key, the song may since have been moved to songs_archive
+    song_id = db.Column(db.Integer, unique=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    points = db.Column(db.Integer, default=0)
+    placement = db.Column(db.Integer)
+    # copied from the song, so results never need the songs table
+    title = db.Column(db.String(512))
+    song_url = db.Column(db.String(512))
+    video_id = db.Column(db.String(32))
+    user = db.relationship('Users')
+
+    def __repr__(self):
+        return f'<Song Id {self.song_id}\tPoints {self.points}\tPlacement {self.placement}>'
+
+
+class PendingNotices(UserMixin, db.Model):
+    __tablename__ = 'pending_notices'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
+    round_id = db.Column(db.Integer, db.ForeignKey('rounds.id'))
+    # round status (see get_round_status) the user was notified about
+    status = db.Column(db.Integer)
+    created = db.Column(db.DateTime, default=datetime.utcnow)
+    user = db.relationship('Users')
+    rounds = db.relationship('Rounds')
+
+    def __repr__(self):
+        return f'<User Id {self.user_id}\tRound Id {self.round_id}\tStatus {self.status}>'
+
+
+class UserStats(UserMixin, db.Model):
+    __tablename__ = 'user_stats'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    total_points = db.Column(db.Integer, default=0)
+    wins = db.Column(db.Integer, default=0)
+    rounds_played = db.Column(db.Integer, default=0)
+    placement_total = db.Column(db.Integer, default=0)
+    user = db.relationship('Users')
+
+    def __repr__(self):
+        return f'<User Id {self.user_id}\tPoints {self.total_points}>'
+
+    @property
+    def avg_placement(self):
+        if not self.rounds_played:
+            return None
+        return round(self.placement_total / self.rounds_played, 2)
@@ -0,0 +1,131 @@
+"""Round status, results and email logic shared by the web app and the send_notices.py cron job.
+
+Only needs the models and mail, so cron jobs can use it without importing the web app.
+"""
+from datetime import datetime
+import os
+
+from flask import current_app, Flask
+from flask_mail import Mail, Message
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.sql.expression import func
+
+from config import Config
+from models import db, Leagues, Rounds, RoundResults, Songs, UserStats, Votes
+
+
+mail = Mail()
+
+
+def create_app():
+    """App with the database, mail and templates set up, but none of the web views, for cron jobs."""
+    app = Flask('musicleague', root_path=os.path.dirname(os.path.abspath(__file__)))
+    app.config.from_object(Config)
+    db.init_app(app)
+    mail.init_app(app)
+    return app
+
+
+def send_async_email(app, msg):
+    with app.app_context():
+        mail.send(msg)
+
+
+def send_email(subject, sender, recipients, text_body, html_body):
+    """Send email."""
+    msg = Message(subject, sender=sender, recipients=recipients)
+    msg.body = text_body
+    msg.html = html_body
+    mail.send(msg)
+
+
+def get_round_status(round_data, user_id):
+    """Determine the status of specified round, based on its stored phase dates.
+
+    returns integer value indicating status:
+        -1 = not started
+        0 = ended/finished
+        1 = voting in progress
+        2 = submissions in progress
+        3 = already submitted a song (can edit submission)
+        4 = already voted
+    """
+    round_status = -1
+    now = datetime.utcnow()
+    if now >= round_data.end_date:
+        round_status = 0
+    elif now >= round_data.vote_start and now < round_data.end_date:
+        voted = has_user_voted(user_id, round_data.id)
+        if voted:
+            round_status = 4
+        else:
+            round_status = 1
+    elif now >= round_data.submit_start and now < round_data.vote_start:
+        submitted = is_song_submitted(user_id, round_data.id)
+        if submitted:
+            round_status = 3
+        else:
+            round_status = 2
+    return round_status
+
+
+def finalize_round(round_data):
+    """Record the final results of an ended round, and roll them up into the all-time user statistics.
+
+    round_data: (Rounds) round to finalize
+    returns True if the round was finalized by this call, False if not ended or already finalized
+    Rounds are claimed with a conditional update, so concurrent callers cannot finalize a round twice.
+    """
+    if round_data.finalized or round_data.end_date > datetime.utcnow():
+        return False
+    claimed = Rounds.query.filter_by(id=round_data.id, finalized=False).update({Rounds.finalized: True})
+    if not claimed:
+        db.session.rollback()
+        return False
+    Leagues.query.filter_by(id=round_data.league_id).update({Leagues.rounds_finished: Leagues.rounds_finished + 1})
+    song_points = db.session.query(
+        Songs.id, Songs.user_id, func.coalesce(func.sum(Votes.votes), 0), Songs.title, Songs.song_url, Songs.video_id
+    ).outerjoin(Votes, Votes.song_id == Songs.id).filter(Songs.round_id == round_data.id).group_by(Songs.id).all()
+    placement = 0
+    previous_points = None
+    # tied songs share a placement
+    for index, (song_id, user_id, points, title, song_url, video_id) in enumerate(sorted(song_points, key=lambda x: x[2], reverse=True), start=1):
+        if points != previous_points:
+            placement = index
+            previous_points = points
+        result = RoundResults(
+            round_id=round_data.id, league_id=round_data.league_id, song_id=song_id, user_id=user_id, points=points, placement=placement,
+            title=title, song_url=song_url, video_id=video_id
+        )
+        db.session.add(result)
+        # upsert, as rounds finalized concurrently may both add the first stats row of a user
+        stats = insert(UserStats).values(
+            user_id=user_id, total_points=points, wins=1 if placement == 1 else 0, rounds_played=1, placement_total=placement
+        )
+        db.session.execute(stats.on_conflict_do_update(index_elements=[UserStats.user_id], set_={
+            'total_points': UserStats.total_points + stats.excluded.total_points,
+            'wins': UserStats.wins + stats.excluded.wins,
+            'rounds_played': UserStats.rounds_played + stats.excluded.rounds_played,
+            'placement_total': UserStats.placement_total + stats.excluded.placement_total,
+        }))
+    db.session.commit()
+    current_app.logger.info(f'Finalized round {round_data.id} with {len(song_points)} songs')
+    return True
+
+
+def is_song_submitted(user_id, round_id):
+    """Determine whether this user already submitted a song for this round."""
+    is_submitted = False
+    songs = Songs.query.filter_by(user_id=user_id).filter_by(round_id=round_id).first()
+    if songs:
+        is_submitted = True
+    return is_submitted
+
+
+def has_user_voted(user_id, round_id):
+    """Determine whether this user has already voted in this round."""
+    has_voted = False
+    votes = Votes.query.filter_by(user_id=user_id).filter_by(round_id=round_id).first()
+    if votes:
+        has_voted = True
+    return has_voted
@@ -0,0 +1,180 @@
+"""Sampling profiler for individual requests, saved in the speedscope (https://www.speedscope.app) file format."""
+from collections import Counter
+from datetime import datetime
+import json
+import os
+import sys
+import time
+
+from flask import g, has_request_context
+
+
+SPEEDSCOPE_SCHEMA = 'https://www.speedscope.app/file-format-schema.json'
+PROFILE_SUFFIX = '.speedscope.json'
+
+
+class RequestProfiler():
+    """Samples the call stack of the current thread, and records the SQL queries it runs.
+
+    A profile function (sys.setprofile) on the request's thread takes a sample at the first function call
+    or return after every interval (seconds), weighted by the time since the previous sample. Time spent
+    in a long C call, such as waiting for the database or youtube, is sampled when that call returns.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        # function (or template line) to its position in frames
+        self.frame_ids = {}
+        self.frames = []
+        self.samples = []
+        self.weights = []
+        self.queries = []
+        self.start_time = self.end_time = self.last_sample = None
+
+    def start(self):
+        self.start_time = self.last_sample = time.perf_counter()
+        sys.setprofile(self.profile)
+
+    def stop(self):
+        sys.setprofile(None)
+        self.end_time = time.perf_counter()
+
+    def profile(self, frame, event, arg):
+        now = time.perf_counter()
+        if now - self.last_sample < self.interval:
+            return
+        stack = []
+        if event in ('c_return', 'c_exception'):
+            stack.append(self.builtin_id(arg))
+        while frame:
+            stack.append(self.frame_id(frame))
+            frame = frame.f_back
+        stack.reverse()
+        self.samples.append(stack)
+        self.weights.append((now - self.last_sample) * 1000)
+        # leave out the time spent sampling
+        self.last_sample = time.perf_counter()
+
+    def builtin_id(self, function):
+        name = getattr(function, '__qualname__', repr(function))
+        module = getattr(function, '__module__', None) or '<built-in>'
+        return self.add_frame((module, name), {'name': f'{module}.{name}' if module != '<built-in>' else name, 'file': module, 'line': 0})
+
+    def frame_id(self, frame):
+        # compiled jinja templates keep a reference to their template, which maps python lines to template lines
+        template = frame.f_globals.get('__jinja_template__')
+        if template is not None:
+            line = template.get_corresponding_lineno(frame.f_lineno)
+            key = (template.filename, line)
+            details = {'name': f'{template.name}:{line}', 'file': template.filename, 'line': line}
+        else:
+            code = frame.f_code
+            key = (code.co_filename, code.co_firstlineno, code.co_name)
+            details = {'name': code.co_name, 'file': code.co_filename, 'line': code.co_firstlineno}
+        return self.add_frame(key, details)
+
+    def add_frame(self, key, details):
+        if key not in self.frame_ids:
+            self.frame_ids[key] = len(self.frames)
+            self.frames.append(details)
+        return self.frame_ids[key]
+
+    def add_query(self, start, end, statement):
+        self.queries.append((start - self.start_time, end - self.start_time, ' '.join(statement.split())))
+
+    def to_speedscope(self, name):
+        """The call tree samples and the SQL timeline, as two profiles of a speedscope file."""
+        frames = list(self.frames)
+        query_ids = {}
+        events = []
+        for start, end, statement in self.queries:
+            if statement not in query_ids:
+                query_ids[statement] = len(frames)
+                frames.append({'name': statement})
+            events.append({'type': 'O', 'frame': query_ids[statement], 'at': start * 1000})
+            events.append({'type': 'C', 'frame': query_ids[statement], 'at': end * 1000})
+        duration = (self.end_time - self.start_time) * 1000
+        return {
+            '$schema': SPEEDSCOPE_SCHEMA,
+            'name': name,
+            'exporter': 'musicleague',
+            'shared': {'frames': frames},
+            'profiles': [
+                {'type': 'sampled', 'name': 'Call tree', 'unit': 'milliseconds', 'startValue': 0, 'endValue': duration,
+                 'samples': self.samples, 'weights': self.weights},
+                {'type': 'evented', 'name': 'SQL', 'unit': 'milliseconds', 'startValue': 0, 'endValue': duration, 'events': events},
+            ],
+        }
+
+
+def record_query_start(conn, cursor, statement, parameters, context, executemany):
+    """SQLAlchemy before_cursor_execute listener, timing the queries of profiled requests."""
+    if has_request_context() and 'profiler' in g:
+        conn.info.setdefault('profile_query_start', []).append(time.perf_counter())
+
+
+def record_query_end(conn, cursor, statement, parameters, context, executemany):
+    """SQLAlchemy after_cursor_execute listener, adding the queries of profiled requests to their profile."""
+    if has_request_context() and 'profiler' in g and conn.info.get('profile_query_start'):
+        g.profiler.add_query(conn.info['profile_query_start'].pop(), time.perf_counter(), statement)
+
+
+def save_profile(profile, directory, details, keep):
+    """Write a speedscope profile to directory, removing the oldest profiles beyond keep, and return its file name.
+
+    details: (list) short, dash free, descriptions of the request, which are part of the file name
+    """
+    os.makedirs(directory, exist_ok=True)
+    filename = '-'.join([f'{datetime.utcnow():%Y%m%d-%H%M%S}'] + details) + PROFILE_SUFFIX
+    with open(os.path.join(directory, filename), 'w') as profile_file:
+        json.dump(profile, profile_file)
+    for old in list_profile_files(directory)[keep:]:
+        try:
+            os.remove(os.path.join(directory, old))
+        except FileNotFoundError:
+            # removed by another worker
+            pass
+    return filename
+
+
+def list_profile_files(directory):
+    """Saved profile file names, newest first."""
+    if not os.path.isdir(directory):
+        return []
+    return sorted((name for name in os.listdir(directory) if name.endswith(PROFILE_SUFFIX)), reverse=True)
+
+
+def parse_profile_filename(filename):
+    """Date and request details of a profile, from its file name."""
+    date, clock, *details = filename.removesuffix(PROFILE_SUFFIX).split('-')
+    return {'filename': filename, 'date': datetime.strptime(date + clock, '%Y%m%d%H%M%S'), 'details': details}
+
+
+def summarize_profile(profile, top):
+    """Slowest functions (by total and self time, in milliseconds) and SQL queries of a speedscope profile."""
+    frames = profile['shared']['frames']
+    sampled, evented = profile['profiles']
+    total_ms = Counter()
+    self_ms = Counter()
+    for stack, weight in zip(sampled['samples'], sampled['weights']):
+        # count recursive functions once per sample
+        for frame_id in set(stack):
+            total_ms[frame_id] += weight
+        if stack:
+            self_ms[stack[-1]] += weight
+    queries = []
+    opened = {}
+    for event in evented['events']:
+        if event['type'] == 'O':
+            opened[event['frame']] = event['at']
+        else:
+            start = opened.pop(event['frame'])
+            queries.append({'start': start, 'ms': event['at'] - start, 'statement': frames[event['frame']]['name']})
+    return {
+        'duration': sampled['endValue'],
+        'sampled_ms': sum(sampled['weights']),
+        'sql_ms': sum(query['ms'] for query in queries),
+        'total': [(frames[frame_id], ms) for frame_id, ms in total_ms.most_common(top)],
+        'self': [(frames[frame_id], ms) for frame_id, ms in self_ms.most_common(top)],
+        'queries': queries,
+    }
@@ -0,0 +1,51 @@
+"""Per-request query counting, N+1 detection and per-endpoint query budgets (see QUERY_BUDGET_MODE)."""
+import os
+import sys
+from collections import Counter, defaultdict
+
+from flask import g, has_request_context
+
+
+APP_DIR = os.path.dirname(os.path.realpath(__file__))
+
+
+class QueryBudgetExceeded(Exception):
+    """A request ran more queries than its endpoint's budget, or the same query over and over (QUERY_BUDGET_MODE=raise)."""
+
+
+def query_origin():
+    """Template line, or else app source line, which caused the query being executed."""
+    frame = sys._getframe(2)
+    while frame:
+        # compiled jinja templates keep a reference to their template, which maps python lines to template lines
+        template = frame.f_globals.get('__jinja_template__')
+        if template is not None:
+            return f'{template.name}:{template.get_corresponding_lineno(frame.f_lineno)}'
+        filename = frame.f_code.co_filename
+        if filename.startswith(APP_DIR) and 'site-packages' not in filename and filename != __file__:
+            return f'{os.path.basename(filename)}:{frame.f_lineno}'
+        frame = frame.f_back
+    return 'unknown'
+
+
+def record_query(conn, cursor, statement, parameters, context, executemany):
+    """SQLAlchemy before_cursor_execute listener, which records the queries of requests being counted."""
+    if has_request_context() and 'queries' in g:
+        g.queries.append((statement, query_origin()))
+
+
+def check_query_budget(queries, budget, repeat_threshold):
+    """Problems with a request's (statement, origin) queries: going over budget, and statements repeated
+    at least repeat_threshold times, which is usually a lazy loaded relationship inside a loop (N+1)."""
+    problems = []
+    if len(queries) > budget:
+        problems.append(f'{len(queries)} queries, over the budget of {budget}')
+    origins = defaultdict(Counter)
+    for statement, origin in queries:
+        origins[statement][origin] += 1
+    for statement, counts in origins.items():
+        total = sum(counts.values())
+        if total >= repeat_threshold:
+            where = ', '.join(f'{origin} ({count}x)' for origin, count in counts.most_common(3))
+            problems.append(f'{total} identical queries from {where}: {" ".join(statement.split())[:200]}')
+    return problems
@@ -1,21 +1,26 @@
 #!/usr/bin/env python
 """Used to generate cron driven slack & email notifications"""
 
+from collections import defaultdict
 from dataclasses import dataclass
 import datetime
+from itertools import groupby
 import os
 import random
 
 from dotenv import load_dotenv
 
-load_dotenv(f'{os.path.dirname(os.path.realpath(__file__))}/.flaskenv')  # needed by musicleague module imports
+load_dotenv(f'{os.path.dirname(os.path.realpath(__file__))}/.flaskenv')  # needed by config module imports
 from flask import render_template
 import html2text
-from musicleague import app, db, get_round_status, send_email, LeagueMembers, Leagues, Rounds
-from slack_sdk import WebClient
-from slack_sdk.errors import SlackApiError
+from sqlalchemy.orm import joinedload
+from sqlalchemy.sql.expression import func
+from models import db, LeagueMembers, PendingNotices, Rounds
+from notifications import create_app, finalize_round, get_round_status, send_email
 
 
+# only the models and notification logic, not the web app and its dependencies
+app = create_app()
 app.config['PREFERRED_URL_SCHEME'] = os.environ['PREFERRED_URL_SCHEME']
 app.config['SERVER_NAME'] = os.environ['SERVER_NAME']
 
@@ -27,82 +32,167 @@ class EmailStateData:
     status_str: str
 
 
-def make_emails():
-    """Find rounds that are ready for submission, voting or ended, and send out notifications."""
+@dataclass
+class Notice:
+    """A round which a user needs to act on (or see the results of)."""
+    round_data: Rounds
+    status_data: EmailStateData
+    url: str
+
+
+running_email_states = {
+    1: EmailStateData(id=1, db='vote_email', status_str='submit your vote'),
+    2: EmailStateData(id=2, db='submit_email', status_str='submit your song'),
+}
+end_states = {
+    0: EmailStateData(id=0, db='end_email', status_str='view round voting results'),
+}
+email_states = {**running_email_states, **end_states}
+
+
+def notice_url(round_data, status_id):
+    """League page of a running round, or the results page of an ended round."""
     base_url = f"{app.config['PREFERRED_URL_SCHEME']}://{app.config['SERVER_NAME']}{app.config['APP_WEB_PATH']}"
-    running_email_states = {
-        1: EmailStateData(id=1, db='vote_email', status_str='submit your vote'),
-        2: EmailStateData(id=2, db='submit_email', status_str='submit your song'),
-    }
-    end_states = {
-        0: EmailStateData(id=0, db='end_email', status_str='view round voting results'),
-    }
+    if status_id in end_states:
+        return f'{base_url}/round?id={round_data.id}'
+    return f'{base_url}/league?id={round_data.league_id}'
+
+
+def make_emails():
+    """Find rounds that are ready for submission, voting or ended, and send out notifications.
+
+    The notices of each user are collected first, then sent one email per round to users with the immediate
+    notify_mode, and as a single digest email to the others (see deliver_notices). A round is only flagged as
+    notified once all of its emails were sent (or queued), so that failed ones are sent again next run.
+    """
     now = datetime.datetime.utcnow()
-    # get league rounds which have not finished yet, for running_email_states
-    unfinished_leagues = Leagues.query.filter(Leagues.end_date >= now).all()
-    for league in unfinished_leagues:
-        url = f'{base_url}/league?id={league.id}'
-        members = LeagueMembers.query.filter_by(league_id=league.id).all()
-        if not members:
-            app.logger.warning(f'Zero members in league {league.name} ({league.id})')
+    # roll up results of rounds which have just finished, for the all-time leaderboard
+    for round_ in Rounds.query.filter_by(finalized=False).filter(Rounds.end_date <= now).all():
+        finalize_round(round_)
+    # rounds in a running phase which have not been notified yet, found via range scans on the phase date indexes
+    phase_rounds = {
+        1: Rounds.query.filter(Rounds.vote_start <= now, Rounds.end_date > now, Rounds.vote_email.is_(False)),
+        2: Rounds.query.filter(Rounds.submit_start <= now, Rounds.vote_start > now, Rounds.submit_email.is_(False)),
+        # league rounds which have just finished
+        0: Rounds.query.filter(Rounds.end_date <= now, Rounds.end_email.is_(False)),
+    }
+    notices = defaultdict(list)
+    notified = []
+    for status_id, status_data in email_states.items():
+        for round_data in phase_rounds[status_id].all():
+            league = round_data.leagues
+            url = notice_url(round_data, status_id)
+            members = LeagueMembers.query.filter_by(league_id=league.id).options(joinedload(LeagueMembers.user)).all()
+            if not members:
+                app.logger.warning(f'Zero members in league {league.name} ({league.id})')
+                continue
+            recipients = 0
+            for member in members:
+                # everyone gets the results, but only members who have not submitted (or voted) yet get reminded
+                if status_id in end_states or get_round_status(round_data, member.user.id) == status_id:
+                    notices[member.user].append(Notice(round_data=round_data, status_data=status_data, url=url))
+                    recipients += 1
+            if not recipients:
+                continue
+            notified.append((round_data, status_data, url))
+            app.logger.info(f'Found {recipients} "{status_data.db}" notices for league = "{league.name}" round = "{round_data.name}"')
+    failed = deliver_notices(notices)
+    slack_msgs = []
+    for round_data, status_data, url in notified:
+        if (round_data.id, status_data.id) in failed:
+            # flag left unset, so the round's notices are sent again next run
+            app.logger.warning(f'Not all "{status_data.db}" notices for round "{round_data.name}" ({round_data.id}) were sent, retrying next run')
             continue
-        unfinished_rounds = Rounds.query.filter_by(league_id=league.id).filter(Rounds.end_date >= now).all()
-        for round_data in unfinished_rounds:
-            league_round_id = f'league = "{league.name}" round = "{round_data.name}"'
-            for status_id, status_data in running_email_states.items():
-                if getattr(round_data, status_data.db):
-                    # email already generated
-                    continue
-                email_recipients = []
-                email_subject = f'[Music League: {league.name[:20]}] its time to {status_data.status_str} !'
-                for member in members:
-                    round_status = get_round_status(
-                        league.submit_days, league.vote_days, round_data.end_date, round_data.id, member.user.id
-                    )
-                    if round_status == status_id:
-                        # collect members who need to receive this status email
-                        email_recipients.append(member.user.email)
-                # generate emails
-                for recipient in email_recipients:
-                    try:
-                        generate_email(email_subject, [recipient], status_data.status_str, url)
-                    except Exception as err:
-                        app.logger.error(
-                            f'Failed to generate {status_data.db} email for {league_round_id} {recipient} due to error:\t{err}'
-                        )
-                        continue
-                    setattr(round_data, status_data.db, True)
-                if len(email_recipients):
-                    db.session.commit()
-                    app.logger.info(f'Sent {len(email_recipients)} "{status_data.db}" emails for {league_round_id}')
-                    # generate slack message
-                    create_slack_msg(url, email_subject)
-    # get league rounds which have just finished, for end_states
-    unfinished_rounds = Rounds.query.filter_by(end_email=False).filter(Rounds.end_date <= now).all()
-    for round_ in unfinished_rounds:
-        league_id = round_.league_id
-        url = f'{base_url}/round?id={round_.id}'
-        members = LeagueMembers.query.filter_by(league_id=league_id).all()
-        if not members:
-            app.logger.warning(f'Zero members in league {round_.leagues.name} ({league_id})')
+        setattr(round_data, status_data.db, True)
+        if status_data.id in running_email_states:
+            slack_msgs.append((url, f'[Music League: {round_data.leagues.name[:20]}] its time to {status_data.status_str} !'))
+    db.session.commit()
+    if app.config['NOTIFY_DIGEST_WINDOW_MINUTES']:
+        send_pending_digests(now - datetime.timedelta(minutes=app.config['NOTIFY_DIGEST_WINDOW_MINUTES']))
+    for url, msg in slack_msgs:
+        # generate slack message
+        create_slack_msg(url, msg)
+
+
+def deliver_notices(notices):
+    """Email each user's notices: one email per round (immediate), one digest now, or queued for a later digest.
+
+    notices: (dict) Users to their list of Notice
+    returns set of (round id, status id) of the notices which failed to send
+    """
+    sent = queued = 0
+    failed = set()
+    # notices queued by an earlier run, which was retried as some of its other emails failed
+    already_queued = set(PendingNotices.query.with_entities(
+        PendingNotices.user_id, PendingNotices.round_id, PendingNotices.status
+    ).filter(PendingNotices.user_id.in_([user.id for user in notices])).all()) if notices else set()
+    for user, user_notices in notices.items():
+        if user.notify_mode == 'immediate':
+            for notice in user_notices:
+                if send_notice_emails(user, [notice]):
+                    sent += 1
+                else:
+                    failed.add((notice.round_data.id, notice.status_data.id))
+        elif app.config['NOTIFY_DIGEST_WINDOW_MINUTES']:
+            # sent by send_pending_digests, once the user's oldest queued notice is old enough
+            for notice in user_notices:
+                if (user.id, notice.round_data.id, notice.status_data.id) not in already_queued:
+                    db.session.add(PendingNotices(user_id=user.id, round_id=notice.round_data.id, status=notice.status_data.id))
+            queued += len(user_notices)
+        elif send_notice_emails(user, user_notices):
+            sent += 1
+        else:
+            failed.update((notice.round_data.id, notice.status_data.id) for notice in user_notices)
+    total = sum(len(user_notices) for user_notices in notices.values())
+    app.logger.info(f'Sent {sent} emails for {total - queued} notices, and queued {queued} notices for digests, to {len(notices)} users')
+    return failed
+
+
+def send_pending_digests(cutoff):
+    """Send a digest of their queued notices to users whose oldest queued notice was created before cutoff.
+
+    Notices which the user has acted on in the meantime (such as a song submitted) are left out.
+    """
+    users = PendingNotices.query.with_entities(PendingNotices.user_id).group_by(PendingNotices.user_id).having(
+        func.min(PendingNotices.created) <= cutoff
+    )
+    pending = PendingNotices.query.filter(PendingNotices.user_id.in_(users)).options(
+        joinedload(PendingNotices.user), joinedload(PendingNotices.rounds)
+    ).order_by(PendingNotices.user_id, PendingNotices.id).all()
+    notices = defaultdict(list)
+    for row in pending:
+        if get_round_status(row.rounds, row.user_id) == row.status:
+            notices[row.user].append(Notice(round_data=row.rounds, status_data=email_states[row.status], url=notice_url(row.rounds, row.status)))
+    sent = 0
+    for _, rows in groupby(pending, key=lambda row: row.user_id):
+        rows = list(rows)
+        user = rows[0].user
+        if notices[user] and not send_notice_emails(user, notices[user]):
+            # try again next run
             continue
-        league_round_id = f'league = "{round_.leagues.name}" round = "{round_.name}"'
-        for status_id, status_data in end_states.items():
-            email_recipients = [m.user.email for m in members]
-            email_subject = f'[Music League: {round_.leagues.name[:20]}] its time to {status_data.status_str} !'
-            # generate emails
-            for recipient in email_recipients:
-                try:
-                    generate_email(email_subject, [recipient], status_data.status_str, url)
-                except Exception as err:
-                    app.logger.error(
-                        f'Failed to generate {status_data.db} email for {league_round_id} {recipient} due to error:\t{err}'
-                    )
-                    continue
-                setattr(round_, status_data.db, True)
-            if len(email_recipients):
-                db.session.commit()
-                app.logger.info(f'Sent {len(email_recipients)} "{status_data.db}" emails for {league_round_id}')
+        for row in rows:
+            db.session.delete(row)
+        db.session.commit()
+        sent += bool(notices[user])
+    app.logger.info(f'Sent {sent} digest emails for {len(pending)} queued notices')
+
+
+def send_notice_emails(user, notices):
+    """Email a user a single notice, or a digest of several, and return the number of emails sent (0 on failure)."""
+    try:
+        if len(notices) == 1:
+            notice = notices[0]
+            subject = f'[Music League: {notice.round_data.leagues.name[:20]}] its time to {notice.status_data.status_str} !'
+            generate_email(subject, [user.email], notice.status_data.status_str, notice.url)
+        else:
+            html_body = render_template('email_digest.html', notices=notices)
+            subject = f'[Music League] {len(notices)} rounds are waiting for you !'
+            send_email(subject, os.environ['ADMIN_EMAIL'], [user.email], html2text.html2text(html_body), html_body)
+    except Exception as err:
+        rounds = ', '.join(f'"{notice.round_data.name}" ({notice.status_data.db})' for notice in notices)
+        app.logger.error(f'Failed to send email for rounds {rounds} to {user.email} due to error:\t{err}')
+        return 0
+    return 1
 
 
 def create_slack_msg(url, base_msg):
@@ -130,6 +220,9 @@ def create_slack_msg(url, base_msg):
     token = os.environ.get('SLACK_BOT_TOKEN')
     channel = os.environ.get('SLACK_CHANNEL')
     msg = f':tada: {base_msg} {" ".join(random.sample(emojis, k=3))} {url}'
+    # only imported when slack is configured
+    from slack_sdk import WebClient
+    from slack_sdk.errors import SlackApiError
     try:
         client = WebClient(token=token)
         client.chat_postMessage(channel=channel, text=msg)
@@ -0,0 +1,18 @@
+// Register the service worker (templates/sw.js), and offer to reload a page it showed from the device once it has changed.
+if ('serviceWorker' in navigator) {
+    navigator.serviceWorker.register(document.currentScript.dataset.serviceWorker);
+    navigator.serviceWorker.addEventListener('message', (event) => {
+        if (event.data.type !== 'page-updated' || event.data.url !== window.location.href || document.getElementById('page-updated')) {
+            return;
+        }
+        const notice = document.createElement('div');
+        notice.id = 'page-updated';
+        notice.className = 'alert alert-info';
+        notice.append('This page has changed since it was saved on this device. ');
+        const reload = document.createElement('a');
+        reload.href = window.location.href;
+        reload.textContent = 'Reload';
+        notice.append(reload);
+        document.getElementById('content').prepend(notice);
+    });
+}
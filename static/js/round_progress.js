@@ -0,0 +1,26 @@
+// Live submission/voting progress for elements with a data-round-progress event stream url.
+// The page is reloaded when the round moves on to another phase, as the available actions change.
+function describeProgress(progress) {
+    if (progress.phase === 'submit') {
+        return `${progress.submitted} of ${progress.members} members submitted a song`;
+    }
+    if (progress.phase === 'vote') {
+        return `${progress.voted} of ${progress.members} members voted`;
+    }
+    return '';
+}
+
+document.addEventListener('DOMContentLoaded', () => {
+    document.querySelectorAll('[data-round-progress]').forEach((element) => {
+        const source = new EventSource(element.dataset.roundProgress);
+        source.addEventListener('progress', (event) => {
+            const progress = JSON.parse(event.data);
+            if (progress.phase !== element.dataset.phase) {
+                source.close();
+                window.location.reload();
+                return;
+            }
+            element.textContent = describeProgress(progress);
+        });
+    });
+});
@@ -0,0 +1,24 @@
+// Fetch the votes and comments of a round result the first time its <details data-votes-url> element is opened.
+document.addEventListener('DOMContentLoaded', () => {
+    document.querySelectorAll('details[data-votes-url]').forEach((details) => {
+        details.addEventListener('toggle', () => {
+            if (!details.open || details.dataset.loaded) {
+                return;
+            }
+            details.dataset.loaded = 'true';
+            const container = details.querySelector('div');
+            fetch(details.dataset.votesUrl)
+                .then((response) => {
+                    if (!response.ok) {
+                        throw new Error(response.statusText);
+                    }
+                    return response.text();
+                })
+                .then((html) => { container.innerHTML = html; })
+                .catch(() => {
+                    container.textContent = 'Failed to load the votes, close and reopen to retry.';
+                    delete details.dataset.loaded;
+                });
+        });
+    });
+});
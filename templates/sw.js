@@ -0,0 +1,111 @@
+// Service worker, rendered by the service_worker view. Static files are served from the device, as their urls change
+// with their content. Recently viewed league, round and standings pages are shown from the device right away, while
+// being revalidated in the background (If-None-Match, usually answered with an empty 304), and offered for reload when
+// they changed. Pages of ended rounds are not revalidated until their max-age has passed.
+const STATIC_CACHE = 'static-{{ version }}';
+const PAGES_CACHE = 'pages';
+const STATIC_URLS = {{ static_urls|tojson }};
+const STATIC_PATH = {{ static_path|tojson }};
+const PAGE_PATHS = {{ page_paths|tojson }};
+// query parameters of plain page views, any other (such as joining a league) is an action
+const PAGE_PARAMS = ['id', 'page', 'edit', 'song'];
+const LOGOUT_PATH = {{ logout_path|tojson }};
+const MAX_PAGES = {{ max_pages }};
+
+self.addEventListener('install', (event) => {
+    event.waitUntil(caches.open(STATIC_CACHE).then((cache) => cache.addAll(STATIC_URLS)).then(() => self.skipWaiting()));
+});
+
+self.addEventListener('activate', (event) => {
+    // static files of earlier deploys are no longer linked from any page
+    event.waitUntil(caches.keys()
+        .then((names) => Promise.all(names.filter((name) => name.startsWith('static-') && name !== STATIC_CACHE).map((name) => caches.delete(name))))
+        .then(() => self.clients.claim()));
+});
+
+self.addEventListener('fetch', (event) => {
+    const request = event.request;
+    const url = new URL(request.url);
+    if (url.origin !== self.location.origin) {
+        return;
+    }
+    if (request.method !== 'GET' || url.pathname === LOGOUT_PATH) {
+        // forms change what the saved pages show, and logins whose pages they are
+        event.respondWith(caches.delete(PAGES_CACHE).then(() => fetch(request)));
+    } else if (url.pathname.startsWith(STATIC_PATH) && url.searchParams.has('v')) {
+        event.respondWith(cacheFirst(request));
+    } else if (PAGE_PATHS.includes(url.pathname)) {
+        if ([...url.searchParams.keys()].every((key) => PAGE_PARAMS.includes(key))) {
+            event.respondWith(staleWhileRevalidate(event));
+        } else {
+            event.respondWith(caches.delete(PAGES_CACHE).then(() => fetch(request)));
+        }
+    }
+});
+
+async function cacheFirst(request) {
+    const cache = await caches.open(STATIC_CACHE);
+    const cached = await cache.match(request);
+    if (cached) {
+        return cached;
+    }
+    const response = await fetch(request);
+    if (response.ok) {
+        await cache.put(request, response.clone());
+    }
+    return response;
+}
+
+async function staleWhileRevalidate(event) {
+    const cache = await caches.open(PAGES_CACHE);
+    const cached = await cache.match(event.request.url);
+    if (cached && isFresh(cached)) {
+        return cached;
+    }
+    const revalidated = revalidate(cache, event, cached);
+    if (cached) {
+        event.waitUntil(revalidated.catch(() => undefined));
+        return cached;
+    }
+    return revalidated.catch(() => offlineResponse());
+}
+
+async function revalidate(cache, event, cached) {
+    const request = event.request;
+    const headers = new Headers();
+    if (cached && cached.headers.has('ETag')) {
+        headers.set('If-None-Match', cached.headers.get('ETag'));
+    }
+    // pages which now redirect (such as a round which moved on to voting) are left for the browser to follow
+    const response = await fetch(request.url, {headers, credentials: 'same-origin', redirect: request.mode === 'navigate' ? 'manual' : 'follow'});
+    if (response.status === 304) {
+        return cached;
+    }
+    // removed first, so the cache keys stay in the order the pages were last saved
+    await cache.delete(request.url);
+    if (response.status === 200 && response.type === 'basic' && !(response.headers.get('Cache-Control') || '').includes('no-store')) {
+        await cache.put(request.url, response.clone());
+        const keys = await cache.keys();
+        await Promise.all(keys.slice(0, Math.max(0, keys.length - MAX_PAGES)).map((key) => cache.delete(key)));
+    }
+    if (cached) {
+        const client = await self.clients.get(event.resultingClientId || event.clientId);
+        if (client) {
+            client.postMessage({type: 'page-updated', url: request.url});
+        }
+    }
+    return response;
+}
+
+function isFresh(response) {
+    const maxAge = /max-age=(\d+)/.exec(response.headers.get('Cache-Control') || '');
+    const date = Date.parse(response.headers.get('Date'));
+    return Boolean(maxAge) && !Number.isNaN(date) && Date.now() - date < maxAge[1] * 1000;
+}
+
+function offlineResponse() {
+    return new Response('<p>You are offline, and this page has not been viewed on this device yet.</p>', {
+        status: 503,
+        headers: {'Content-Type': 'text/html; charset=utf-8'},
+    });
+}
@@ -0,0 +1,17 @@
+"""Tests, run from the repository root with: python -m unittest discover tests
+
+They set up the environment the app needs (see setup_environment), and don't need network access. The few which
+need a database are skipped unless TEST_DB_URL points at a scratch postgres database.
+"""
+import os
+
+
+def setup_environment():
+    """Settings normally read from .flaskenv, before the app is imported."""
+    os.environ.setdefault('SECRET_KEY', 'test')
+    os.environ.setdefault('MAX_CONTENT_LENGTH', '1048576')
+    os.environ.setdefault('APP_WEB_PATH', '')
+    # only connected to by the tests which need a database, when TEST_DB_URL is set
+    os.environ.setdefault('DB_URL', os.environ.get('TEST_DB_URL') or 'postgresql://ml@127.0.0.1:1/ml')
+    # debug mode skips the log files and mail handler
+    os.environ.setdefault('FLASK_DEBUG', '1')
@@ -0,0 +1,172 @@
+"""Cache backends: TTLs, tag invalidation, single-flight recompute, and the Redis backend against a local stand-in."""
+import tempfile
+import threading
+import time
+import unittest
+
+from tests import setup_environment
+
+setup_environment()
+from caching import FileSystemCache, MemoryCache, RedisCache  # noqa: E402
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+class StandInRedis():
+    """The few Redis commands used by RedisCache, on a dict, failing like a lost connection while down."""
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.down = False
+
+    def check(self, key):
+        if self.down:
+            raise redis.ConnectionError('Connection refused')
+        if key in self.expires and self.expires[key] < time.time():
+            self.data.pop(key, None)
+            del self.expires[key]
+
+    def get(self, key):
+        self.check(key)
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None, nx=False):
+        self.check(key)
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        if ex:
+            self.expires[key] = time.time() + ex
+        return True
+
+    def delete(self, key):
+        self.check(key)
+        return int(self.data.pop(key, None) is not None)
+
+    def incr(self, key):
+        self.check(key)
+        self.data[key] = str(int(self.data.get(key, 0)) + 1).encode()
+        return int(self.data[key])
+
+    def mget(self, keys):
+        return [self.get(key) for key in keys]
+
+
+class CacheBehaviour():
+    """Tests shared by every backend, mixed into a TestCase with a make_cache() method."""
+
+    def setUp(self):
+        self.cache = self.make_cache()
+
+    def test_get_set_delete(self):
+        self.assertIsNone(self.cache.get('key'))
+        self.cache.set('key', {'value': 1})
+        self.assertEqual(self.cache.get('key'), {'value': 1})
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_ttl(self):
+        self.cache.set('key', 'value', ttl=1)
+        self.assertEqual(self.cache.get('key'), 'value')
+        time.sleep(1.1)
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_invalidate_tag(self):
+        self.cache.set('one', 1, tags=['league:1'])
+        self.cache.set('two', 2, tags=['league:2'])
+        self.cache.invalidate_tag('league:1')
+        self.assertIsNone(self.cache.get('one'))
+        self.assertEqual(self.cache.get('two'), 2)
+        # stored again after the invalidation, with the new tag version
+        self.cache.set('one', 1, tags=['league:1'])
+        self.assertEqual(self.cache.get('one'), 1)
+
+    def test_get_or_set_single_flight(self):
+        calls = []
+
+        def create():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'value'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.cache.get_or_set('key', create))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['value'] * 5)
+        self.assertEqual(len(calls), 1)
+
+    def test_get_or_set_nested(self):
+        # a cached value computed from another one, whose key shares the same local lock
+        stripes = len(self.cache.local_locks)
+        inner = next(f'inner{n}' for n in range(10000) if hash(f'inner{n}') % stripes == hash('outer') % stripes)
+        results = []
+
+        def create():
+            return self.cache.get_or_set(inner, lambda: 'inner value') + ' and outer value'
+
+        thread = threading.Thread(target=lambda: results.append(self.cache.get_or_set('outer', create)), daemon=True)
+        thread.start()
+        thread.join(2)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(results, ['inner value and outer value'])
+
+
+class MemoryCacheTest(CacheBehaviour, unittest.TestCase):
+
+    def make_cache(self):
+        return MemoryCache(100, lock_timeout=5)
+
+    def test_lru_eviction(self):
+        cache = MemoryCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+
+
+class FileSystemCacheTest(CacheBehaviour, unittest.TestCase):
+
+    def make_cache(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        return FileSystemCache(cache_dir.name, lock_timeout=5)
+
+    def test_shared_between_instances(self):
+        other = FileSystemCache(self.cache.cache_dir)
+        self.cache.set('key', 'value', tags=['league:1'])
+        self.assertEqual(other.get('key'), 'value')
+        other.invalidate_tag('league:1')
+        self.assertIsNone(self.cache.get('key'))
+
+
+@unittest.skipUnless(redis, 'needs the redis package')
+class RedisCacheTest(CacheBehaviour, unittest.TestCase):
+
+    def make_cache(self):
+        cache = RedisCache('redis://localhost:6379/0', lock_timeout=5)
+        cache.client = self.server = StandInRedis()
+        return cache
+
+    def test_server_down(self):
+        self.cache.set('key', 'value', tags=['league:1'])
+        self.server.down = True
+        with self.assertLogs('musicleague', 'WARNING'):
+            self.assertIsNone(self.cache.get('key'))
+            self.cache.set('key', 'other')
+            self.cache.delete('key')
+            self.cache.invalidate_tag('league:1')
+            self.assertEqual(self.cache.get_or_set('new', lambda: 'computed', tags=['league:1']), 'computed')
+        self.server.down = False
+        self.assertEqual(self.cache.get('key'), 'value')
+
+
+if __name__ == '__main__':
+    unittest.main()
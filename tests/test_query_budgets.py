@@ -0,0 +1,93 @@
+"""Query budgets of the budgeted pages (config.py QUERY_BUDGETS), against a scratch postgres database.
+
+Set TEST_DB_URL to a database used for nothing else (with the ml role and pg_trgm available), as its public
+schema is dropped and created again from ml.sql. Skipped without one.
+"""
+from datetime import datetime, timedelta
+import os
+import unittest
+
+from tests import setup_environment
+
+setup_environment()
+from flask import g, request  # noqa: E402
+
+from musicleague import app, cache, get_leaderboard_version  # noqa: E402
+from models import db, LeagueMembers, Leagues, Rounds, Songs, Users, Votes  # noqa: E402
+from notifications import finalize_round  # noqa: E402
+from query_budget import check_query_budget  # noqa: E402
+
+
+@unittest.skipUnless(os.environ.get('TEST_DB_URL'), 'TEST_DB_URL is not set')
+class QueryBudgetTests(unittest.TestCase):
+    # enough of everything for a lazy loaded relationship inside a loop to show up as an N+1 query
+    user_count = 8
+    league_count = 6
+
+    @classmethod
+    def setUpClass(cls):
+        app.config.update(TESTING=True, WTF_CSRF_ENABLED=False, QUERY_BUDGET_MODE='log')
+        with app.app_context():
+            with db.engine.connect() as connection:
+                connection.exec_driver_sql('DROP SCHEMA public CASCADE; CREATE SCHEMA public; GRANT USAGE ON SCHEMA public TO PUBLIC')
+                with open(os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'ml.sql')) as schema:
+                    connection.exec_driver_sql(schema.read())
+                connection.commit()
+            # ml.sql empties the search_path of the connection it ran on
+            db.engine.dispose()
+            users = []
+            for n in range(cls.user_count):
+                # one at a time, batched inserts would cast the usernames to the model's (integer) column type
+                users.append(Users(username=f'user{n}', email=f'user{n}@example.org', name=f'User {n}', passwd='x'))
+                db.session.add(users[-1])
+                db.session.flush()
+            now = datetime.utcnow()
+            for n in range(cls.league_count):
+                league = Leagues(name=f'League {n}', descr='d', submit_days=2, vote_days=2, upvotes=3, downvotes=1, round_count=1, owner_id=users[0].id, end_date=now - timedelta(days=1))
+                db.session.add(league)
+                db.session.flush()
+                round_data = Rounds(league_id=league.id, name=f'Round {n}', descr='d', submit_email=True, vote_email=True, end_email=True)
+                round_data.set_phase_dates(league.end_date, league.submit_days, league.vote_days)
+                db.session.add(round_data)
+                db.session.flush()
+                songs = []
+                for user in users:
+                    db.session.add(LeagueMembers(league_id=league.id, user_id=user.id))
+                    songs.append(Songs(
+                        league_id=league.id, round_id=round_data.id, user_id=user.id, song_url='https://youtu.be/aaaaaaaaaaa',
+                        video_id='aaaaaaaaaaa', title=f'Song {n} {user.id}', thumbnail='https://i.ytimg.com/vi/aaaaaaaaaaa/default.jpg'
+                    ))
+                db.session.add_all(songs)
+                db.session.flush()
+                for index, user in enumerate(users):
+                    db.session.add(Votes(league_id=league.id, round_id=round_data.id, song_id=songs[index - 1].id, user_id=user.id, votes=3))
+                db.session.commit()
+                finalize_round(round_data)
+            cls.user_id = users[0].id
+
+    def assert_within_budget(self, endpoint, url):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(self.user_id)
+            session['_fresh'] = True
+        # keeps the request context around after the request, for its recorded queries
+        with client:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(request.endpoint, endpoint)
+            budget = app.config['QUERY_BUDGETS'][endpoint]
+            self.assertEqual(check_query_budget(g.queries, budget, app.config['QUERY_REPEAT_THRESHOLD']), [])
+
+    def test_budgets(self):
+        pages = {'default': '/', 'leagues': '/leagues', 'leaderboard': '/leaderboard', 'leaderboard_api': '/api/leaderboard'}
+        self.assertEqual(set(pages), set(app.config['QUERY_BUDGETS']))
+        for endpoint, path in pages.items():
+            with self.subTest(endpoint=endpoint):
+                # a cached page would not run its queries
+                with app.app_context():
+                    cache.delete(f'leaderboard:api:{get_leaderboard_version()}:1')
+                self.assert_within_budget(endpoint, app.config['APP_WEB_PATH'] + path)
+
+
+if __name__ == '__main__':
+    unittest.main()
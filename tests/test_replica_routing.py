@@ -0,0 +1,62 @@
+"""Read replica routing of RoutingSession, with two SQLite files standing in for the primary and the replica."""
+import os
+import tempfile
+import unittest
+
+from flask import Flask, g
+
+from models import db, Icons
+
+
+class ReplicaRoutingTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(self.tmp.name, 'primary.db')}"
+        self.app.config['SQLALCHEMY_BINDS'] = {'replica': f"sqlite:///{os.path.join(self.tmp.name, 'replica.db')}"}
+        db.init_app(self.app)
+        with self.app.app_context():
+            # the replica lags behind: it has not seen the primary's second icon yet
+            for engine, icon_count in ((db.engines[None], 2), (db.engines['replica'], 1)):
+                Icons.__table__.create(engine)
+                with engine.begin() as connection:
+                    connection.execute(Icons.__table__.insert(), [{'icon': b'x', 'user_id': 1}] * icon_count)
+
+    def tearDown(self):
+        with self.app.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
+        self.tmp.cleanup()
+
+    def test_reads_use_primary_by_default(self):
+        with self.app.test_request_context():
+            self.assertEqual(Icons.query.count(), 2)
+
+    def test_reads_use_replica_when_opted_in(self):
+        with self.app.test_request_context():
+            g.use_replica = True
+            self.assertEqual(Icons.query.count(), 1)
+
+    def test_reads_after_flush_use_primary(self):
+        with self.app.test_request_context():
+            g.use_replica = True
+            db.session.add(Icons(icon=b'y', user_id=2))
+            db.session.flush()
+            self.assertTrue(g.db_wrote)
+            self.assertEqual(Icons.query.count(), 3)
+            db.session.commit()
+            self.assertEqual(Icons.query.count(), 3)
+
+    def test_reads_after_dml_use_primary(self):
+        with self.app.test_request_context():
+            g.use_replica = True
+            self.assertEqual(Icons.query.count(), 1)
+            Icons.query.filter_by(user_id=1).update({Icons.user_id: 3})
+            self.assertTrue(g.db_wrote)
+            self.assertEqual(Icons.query.filter_by(user_id=3).count(), 2)
+            db.session.rollback()
+
+
+if __name__ == '__main__':
+    unittest.main()
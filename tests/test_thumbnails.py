@@ -0,0 +1,87 @@
+"""Thumbnail cache, fetching from a local HTTP stub standing in for the youtube image CDN."""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import io
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from PIL import Image
+
+from tests import setup_environment
+
+setup_environment()
+import musicleague  # noqa: E402
+
+
+class StubCDN(BaseHTTPRequestHandler):
+    """Serves a 480x360 JPEG for every path, and records the paths asked for."""
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        image = io.BytesIO()
+        Image.new('RGB', (480, 360), 'red').save(image, 'JPEG')
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(image.getvalue())))
+        self.end_headers()
+        self.wfile.write(image.getvalue())
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThumbnailTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubCDN)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        StubCDN.requests.clear()
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        config = {
+            'THUMBNAIL_CACHE_DIR': cache_dir.name,
+            'THUMBNAIL_SOURCE_URL': f'http://127.0.0.1:{self.server.server_port}/vi/{{video_id}}/default.jpg',
+        }
+        patcher = mock.patch.dict(musicleague.app.config, config)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # videos known as songs, instead of looking them up in the database
+        patcher = mock.patch.object(musicleague, 'is_song_video', lambda video_id: video_id == 'dQw4w9WgXcQ')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = musicleague.app.test_client()
+
+    def test_fetched_once_and_resized(self):
+        for _ in range(2):
+            response = self.client.get('/thumb/dQw4w9WgXcQ.jpg')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.mimetype, 'image/jpeg')
+            self.assertEqual(Image.open(io.BytesIO(response.data)).size, musicleague.app.config['THUMBNAIL_SIZE'])
+            self.assertEqual(response.cache_control.max_age, musicleague.app.config['THUMBNAIL_MAX_AGE'])
+            response.close()
+        self.assertEqual(StubCDN.requests, ['/vi/dQw4w9WgXcQ/default.jpg'])
+
+    def test_unknown_video_not_fetched(self):
+        response = self.client.get('/thumb/AAAAAAAAAAA.jpg')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(StubCDN.requests, [])
+        with musicleague.app.app_context():
+            self.assertIsNone(musicleague.get_cached_thumbnail('AAAAAAAAAAA'))
+
+    def test_invalid_video_id(self):
+        self.assertEqual(self.client.get('/thumb/..%2F..%2Fetc.jpg').status_code, 404)
+        self.assertEqual(StubCDN.requests, [])
+
+
+if __name__ == '__main__':
+    unittest.main()